@@ -6,16 +6,164 @@ import logging
 import os
 import csv
 import json
-from datetime import datetime
+import time
+from dataclasses import fields
+from datetime import date, datetime
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, get_flashed_messages
+from flask import before_render_template, template_rendered, render_template_string
 
-from utils import manager, models
+try:
+    from werkzeug.security import check_password_hash
+except ImportError:
+    check_password_hash = None
+
+from utils import manager, metrics, models, perfil, secure_backup
 
 # ---------------- AJUSTES DE EXECUÇÃO ----------------
 app = Flask(__name__)
 app.secret_key = "chave_secreta_supersegura"
 
+# Mensagens de diagnóstico do login (stdout); ligue com LOGIN_DEBUG=1
+LOGIN_DEBUG = os.environ.get("LOGIN_DEBUG", "").strip().lower() in ("1", "true", "sim")
+
+
+# ---------------- PERFIL SOB DEMANDA ----------------
+# ?perfil=1 (só administradores) perfila a requisição com cProfile: a página sai
+# normal, com o tempo por fase no cabeçalho Server-Timing, e o perfil fica em
+# data/perfis/. ?perfil=texto devolve o relatório no lugar da página. KITS_PERFIL
+# perfila uma amostra das requisições sem pedir; essas só gravam o perfil, sem
+# mudar a resposta. Registrado primeiro, para cobrir os demais ganchos, inclusive
+# o commit da transação.
+
+PERFIS_DIR = os.path.join(manager.DATA_DIR, "perfis")
+_fases_perfil = None
+
+
+def fases_perfil():
+    """Fases do perfil: armazenamento (motor, cache, secure_backup), conversão de registros e render."""
+    global _fases_perfil
+    if _fases_perfil is None:
+        armazenamento = perfil.chaves_classe(*manager.MOTORES.values()) | perfil.chaves(
+            manager._tabela_versionada, manager._gravar_tabelas)
+        conversao = perfil.chaves(flatten_record, normalize, models.row_to_record, models.rows_to_records,
+                                  models.record_to_row, manager.dicts_to_objects, manager.objects_to_dicts)
+        render = perfil.chaves(render_template, render_template_string)
+        _fases_perfil = {
+            "armazenamento": lambda chave: chave[0] == secure_backup.__file__ or chave in armazenamento,
+            "conversao": conversao.__contains__,
+            "render": render.__contains__,
+        }
+    return _fases_perfil
+
+
+@app.before_request
+def iniciar_perfil():
+    pedido = request.args.get("perfil")
+    if session.get("usuario", {}).get("nome_classe") != "Administrador":
+        pedido = None  # para os demais, o parâmetro não existe: no máximo a amostra, silenciosa
+    if pedido or perfil.sortear():
+        g.perfil_pedido = pedido
+        g.perfil = perfil.Perfil()
+
+
+@app.after_request
+def encerrar_perfil(response):
+    p = g.pop("perfil", None)
+    if p is None:
+        return response
+    fases = p.encerrar().fases(fases_perfil())
+    pedido = g.pop("perfil_pedido", None)
+    if pedido == "texto":
+        resumo = "\n".join(f"{fase:<14}{segundos * 1000:10.2f} ms" for fase, segundos in fases.items())
+        response = app.response_class(
+            f"{request.method} {request.full_path} -> {response.status_code}\n\n{resumo}\n\n{p.texto()}",
+            mimetype="text/plain")
+    else:
+        caminho = p.salvar(PERFIS_DIR, request.endpoint or "desconhecido", {
+            "url": request.full_path, "metodo": request.method, "status": response.status_code, "fases_s": fases})
+        if pedido:
+            response.headers["X-Perfil"] = os.path.basename(caminho)
+    if pedido:
+        response.headers["Server-Timing"] = perfil.server_timing(fases)
+    return response
+
+
+@app.teardown_request
+def descartar_perfil(exc):
+    p = g.pop("perfil", None)
+    if p is not None:
+        p.encerrar()  # a requisição falhou antes do after_request: só desliga o profiler
+
+
+# ---------------- MÉTRICAS POR REQUISIÇÃO ----------------
+# Tempo de cada rota (incluindo o commit da transação) e de cada template, quando
+# KITS_METRICAS=1; os tempos do armazenamento vêm de utils/metrics. Registrados antes
+# dos ganchos da transação para que o after_request daqui rode depois do commit.
+
+@app.before_request
+def iniciar_cronometro():
+    if metrics.ativo():
+        g.inicio_requisicao = time.perf_counter()
+
+
+@app.after_request
+def medir_requisicao(response):
+    inicio = g.pop("inicio_requisicao", None)
+    if inicio is not None:
+        endpoint = request.endpoint or "desconhecido"
+        metrics.observar("requisicao_segundos", time.perf_counter() - inicio, endpoint=endpoint, metodo=request.method)
+        metrics.contar("requisicoes_total", endpoint=endpoint, status=response.status_code)
+    return response
+
+
+def iniciar_render(sender, template, context, **extra):
+    if metrics.ativo():
+        g.inicio_render = time.perf_counter()
+
+
+def medir_render(sender, template, context, **extra):
+    inicio = g.pop("inicio_render", None)
+    if inicio is not None:
+        metrics.observar("render_segundos", time.perf_counter() - inicio, template=template.name)
+
+
+before_render_template.connect(iniciar_render, app)
+template_rendered.connect(medir_render, app)
+
+
+# ---------------- TRANSAÇÃO POR REQUISIÇÃO ----------------
+# Cada requisição lê um snapshot das tabelas (decifradas no máximo uma vez) e grava
+# tudo o que alterou de uma vez, ao final. Se a view levantar exceção, ou se alguma
+# operação do manager falhar (mesmo tratada pela view), nada é gravado. Se outra
+# requisição gravou antes as mesmas tabelas, a resposta da view é trocada por um
+# 409 (API) ou por um aviso e o retorno à página (telas).
+
+@app.before_request
+def abrir_transacao():
+    g.transacao = manager.abrir_transacao()
+
+
+@app.after_request
+def gravar_transacao(response):
+    if g.pop("transacao", None) is None:
+        return response
+    try:
+        manager.fechar_transacao(gravar=response.status_code < 500)
+    except manager.ConflitoTransacao as e:
+        if request.path.startswith("/api/"):
+            return app.make_response(api_erro(str(e), 409))
+        get_flashed_messages()  # descarta o "sucesso" que a view já tinha dado
+        flash(f"Nada foi gravado. {e}.", "danger")
+        return redirect(request.referrer or url_for("home"))
+    return response
+
+
+@app.teardown_request
+def descartar_transacao(exc):
+    if g.pop("transacao", None) is not None:
+        manager.fechar_transacao(gravar=False)
+
 
 # ======================= HELPERS =======================
 
@@ -33,11 +181,14 @@ def normalize(value):
 def flatten_record(u):
     """
     Converte formatos estranhos em dict plano.
-    Suporta: dict(s) e dataclass/objeto (usa vars()).
+    Suporta: dict(s), registros com __slots__ e dataclass/objeto (usa vars()).
     """
     if isinstance(u, dict):
         return u
 
+    if hasattr(u, "__slots__"):
+        return {k: getattr(u, k) for k in u.__slots__ if not k.startswith("_")}
+
     if hasattr(u, "__dict__"):
         return {k: v for k, v in vars(u).items() if not k.startswith("_")}
 
@@ -57,29 +208,61 @@ def build_class_map(usuarios_flat):
     return m
 
 
-def gerar_id_item():
-    """Gera próximo id_item numérico com 4 dígitos baseado nos itens atuais do estoque (via storage seguro)."""
+POR_PAGINA_PADRAO = 50
+POR_PAGINA_OPCOES = (25, 50, 100, 200)
+
+
+def paginar(modelo, prefixo, colunas, aba, where=None):
+    """
+    Página de uma tabela conforme a query string: <prefixo>_col e <prefixo>_q (filtro),
+    <prefixo>_ordem e <prefixo>_dir (ordenação), <prefixo>_pagina e <prefixo>_por.
+    `colunas` (campo -> rótulo) limita o que pode ser filtrado/ordenado.
+    """
+    args = request.args
+    coluna = args.get(f"{prefixo}_col", "")
+    coluna = coluna if coluna in colunas else ""
+    termo = args.get(f"{prefixo}_q", "").strip() if coluna else ""
+    ordem = args.get(f"{prefixo}_ordem", "")
+    ordem = ordem if ordem in colunas else ""
+    desc = args.get(f"{prefixo}_dir") == "desc"
+    por_pagina = args.get(f"{prefixo}_por", POR_PAGINA_PADRAO, type=int)
+    if por_pagina not in POR_PAGINA_OPCOES:
+        por_pagina = POR_PAGINA_PADRAO
+
     try:
-        lista = manager.listar_registros(models.EstoqueItem) or []
+        pag = manager.paginar_registros(
+            modelo, where=where, busca={coluna: termo} if termo else None, ordem=ordem or None, desc=desc,
+            pagina=args.get(f"{prefixo}_pagina", 1, type=int), por_pagina=por_pagina,
+        )
     except Exception:
-        lista = []
+        pag = {"registros": [], "total": 0, "pagina": 1, "paginas": 1, "por_pagina": por_pagina}
 
-    max_n = 0
-    for e in lista:
-        rec = flatten_record(e)
-        s = str(rec.get("id_item", "")).strip()
-        if s.isdigit():
-            max_n = max(max_n, int(s))
-    proximo = max_n + 1 if max_n >= 0 else 1
-    return str(proximo).zfill(4)
+    pag["itens"] = [flatten_record(r) for r in pag.pop("registros")]
+    pag.update(prefixo=prefixo, colunas=colunas, aba=aba, coluna=coluna, termo=termo,
+               ordem=ordem, desc=desc, filtrado=bool(termo))
+    return pag
 
 
-def senha_confere(senha_digitada: str, senha_armazenada: str) -> bool:
-    """Suporta hash (Werkzeug) OU texto puro (CSV)."""
+@app.template_global()
+def url_pagina(pag, **mudancas):
+    """URL da view atual com os parâmetros da tabela de `pag` trocados (None remove), na aba dela."""
+    args = request.args.to_dict()
+    args["aba"] = pag["aba"]
+    for nome, valor in mudancas.items():
+        args[f"{pag['prefixo']}_{nome}"] = valor
+    return url_for(request.endpoint, **{k: v for k, v in args.items() if v not in (None, "")})
+
+
+def gerar_id_item():
+    """Próximo id_item da sequência persistida do estoque (sem reservá-lo)."""
     try:
-        from werkzeug.security import check_password_hash
+        return manager.proximo_id(models.EstoqueItem)
     except Exception:
-        check_password_hash = None
+        return ""
+
+
+def senha_confere(senha_digitada: str, senha_armazenada: str) -> bool:
+    """Suporta hash (Werkzeug) OU texto puro (CSV)."""
     sd = normalize(senha_digitada)
     sa = normalize(senha_armazenada)
     if not sa:
@@ -92,50 +275,38 @@ def senha_confere(senha_digitada: str, senha_armazenada: str) -> bool:
     return sd == sa
 
 
-# ======= Catálogo de kits/itens/tamanhos usando o storage seguro =======
+def login_debug(*args):
+    if LOGIN_DEBUG:
+        print("[LOGIN DEBUG]", *args)
+
+
+def autenticar(login: str, senha: str):
+    """Dados de sessão do usuário, ou None: uma busca no índice de logins + uma verificação de senha."""
+    usuario = manager.buscar_usuario_por_login(normalize(login))
+    if usuario is None:
+        login_debug(f"Usuário '{login}' não encontrado.")
+        return None
+    if not senha_confere(senha, usuario.senha or ""):
+        login_debug("Senha não confere para:", usuario.usuario)
+        return None
+    return {
+        "id_usuario":  normalize(usuario.id_usuario),
+        "usuario":     normalize(usuario.usuario),
+        "nome":        normalize(usuario.nome),
+        "email":       normalize(usuario.email),
+        "id_classe":   normalize(usuario.id_classe),
+        "nome_classe": normalize(usuario.nome_classe),
+    }
 
-def _build_kit_catalog_from_rows(rows):
-    kit_catalog = {}
-    size_order = ["PP", "P", "M", "G", "GG", "XG", "XXG", "XXL"]
-
-    for row in rows or []:
-        r = flatten_record(row)
-        id_kit = (r.get("id_kit") or "").strip()
-        nome = (r.get("nome_kit") or "").strip()
-        item_nm = (r.get("item") or "").strip()
-        size = (r.get("tamanho_camisa") or "").strip()
-
-        if not nome:
-            continue
-        if nome not in kit_catalog:
-            kit_catalog[nome] = {"id_kit": id_kit, "items": {}}
-        else:
-            if not kit_catalog[nome].get("id_kit") and id_kit:
-                kit_catalog[nome]["id_kit"] = id_kit
-
-        if item_nm:
-            kit_catalog[nome]["items"].setdefault(item_nm, [])
-            if size and size not in kit_catalog[nome]["items"][item_nm]:
-                kit_catalog[nome]["items"][item_nm].append(size)
-
-    # ordenar tamanhos
-    for _, data in kit_catalog.items():
-        for it, sizes in list(data["items"].items()):
-            uniq = list(dict.fromkeys(sizes))
-            uniq.sort(key=lambda s: (size_order.index(s) if s in size_order else 999, s))
-            data["items"][it] = uniq
-
-    nomes_kits_ordenados = sorted(kit_catalog.keys(), key=lambda s: s.lower())
-    return kit_catalog, nomes_kits_ordenados
 
+# ======= Catálogo de kits/itens/tamanhos usando o storage seguro =======
 
 def load_kit_catalog_csv():
-    """Nome legado mantido: agora lê via manager.read_csv(Kit)."""
+    """Nome legado mantido: agora usa o catálogo em cache do manager (refeito só quando os kits mudam)."""
     try:
-        rows = manager.read_csv(models.Kit)  # usa restore/backup por dentro
+        return manager.catalogo_kits()
     except Exception:
-        rows = []
-    return _build_kit_catalog_from_rows(rows)
+        return {}, []
 
 
 def carregar_kits_catalogo_csv():
@@ -143,52 +314,6 @@ def carregar_kits_catalogo_csv():
     return load_kit_catalog_csv()
 
 
-def carregar_usuarios_unificado():
-    """
-    1) Tenta via manager.listar_registros(models.Usuario) (objetos).
-    2) Fallback: manager.read_csv(models.Usuario) (dicts).
-    Retorna lista de dicts padronizados.
-    """
-    usuarios_norm = []
-
-    try:
-        lista = manager.listar_registros(models.Usuario) or []
-    except Exception:
-        lista = []
-    for u in lista:
-        rec = flatten_record(u)
-        usuarios_norm.append({
-            "id_usuario": normalize(rec.get("id_usuario") or rec.get("id") or rec.get("user_id")),
-            "usuario": normalize(rec.get("usuario") or rec.get("login") or rec.get("username") or rec.get("nome_usuario")),
-            "senha": rec.get("senha") or rec.get("password") or rec.get("hash_senha"),
-            "nome": normalize(rec.get("nome") or rec.get("nome_completo") or rec.get("name")),
-            "email": normalize(rec.get("email")),
-            "id_classe": normalize(rec.get("id_classe") or rec.get("classe_id")),
-            "nome_classe": normalize(rec.get("nome_classe") or rec.get("perfil") or rec.get("role")),
-        })
-    if usuarios_norm:
-        return usuarios_norm
-
-    # fallback seguro
-    try:
-        rows = manager.read_csv(models.Usuario) or []
-        for r0 in rows:
-            r = flatten_record(r0)
-            usuarios_norm.append({
-                "id_usuario": normalize(r.get("id_usuario")),
-                "usuario": normalize(r.get("usuario")),
-                "senha": r.get("senha", ""),
-                "nome": normalize(r.get("nome")),
-                "email": normalize(r.get("email")),
-                "id_classe": normalize(r.get("id_classe")),
-                "nome_classe": normalize(r.get("nome_classe")),
-            })
-    except Exception as e:
-        print("[LOGIN DEBUG] Fallback seguro falhou:", e)
-
-    return usuarios_norm
-
-
 # ======================= LOG / UTILIDADES =======================
 
 def usuario_atual():
@@ -197,67 +322,23 @@ def usuario_atual():
     return u.get("usuario") or u.get("nome") or "sistema"
 
 
-def imprimir_log_formatado():
-    """Imprime o log formatado usando manager.restore/backup."""
-    manager.restore_data()
-    log_file = os.path.join(manager.DATA_DIR, "logs.csv")
-    if not os.path.exists(log_file):
-        print("\n[LOG] Nenhum log encontrado.")
-        manager.backup_data()
-        return
-
-    print("\n===== LOG DE AÇÕES =====")
-    with open(log_file, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for i, row in enumerate(reader, start=1):
-            print(f"\n#{i} [{row['data']} {row['hora']}] usuário={row['usuario']} ação={row['acao']}")
-            print("  - Antes :", row["linha_antes"])
-            print("  - Depois:", row["linha_depois"])
-    print("========================\n")
-    manager.backup_data()
-
-
 # ======================= ROTAS =======================
 
 # ---------------- LOGIN ----------------
 @app.route("/", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
-        usuario_input = normalize(request.form.get("usuario"))
-        senha_input   = normalize(request.form.get("senha"))
-
-        usuarios = carregar_usuarios_unificado()
-        print("\n[LOGIN DEBUG] total usuarios:", len(usuarios))
-        for i, u in enumerate(usuarios[:5]):  # mostra até 5
-            u_copy = dict(u)
-            if "senha" in u_copy:
-                u_copy["senha"] = "(oculta)"
-            print(f"[LOGIN DEBUG] user[{i}]:", u_copy)
-
-        candidato = next((u for u in usuarios
-                          if u.get("usuario","").lower() == usuario_input.lower()), None)
-
-        if not candidato:
-            flash("Usuário ou senha inválidos!", "danger")
-            print(f"[LOGIN DEBUG] Usuário '{usuario_input}' não encontrado.")
-            return render_template("login.html")
-
-        ok = senha_confere(senha_input, candidato.get("senha",""))
-        print("[LOGIN DEBUG] check senha:", ok)
-        if not ok:
+        try:
+            dados = autenticar(request.form.get("usuario"), request.form.get("senha"))
+        except Exception as e:
+            login_debug("Falha ao autenticar:", e)
+            dados = None
+        if dados is None:
             flash("Usuário ou senha inválidos!", "danger")
-            print("[LOGIN DEBUG] Senha não confere para:", candidato.get("usuario"))
             return render_template("login.html")
 
-        session["usuario"] = {
-            "id_usuario":  candidato.get("id_usuario"),
-            "usuario":     candidato.get("usuario"),
-            "nome":        candidato.get("nome"),
-            "email":       candidato.get("email"),
-            "id_classe":   candidato.get("id_classe"),
-            "nome_classe": candidato.get("nome_classe"),
-        }
-        print("[LOGIN DEBUG] Login OK:", session["usuario"])
+        session["usuario"] = dados
+        login_debug("Login OK:", session["usuario"])
         return redirect(url_for("home"))
 
     return render_template("login.html")
@@ -291,27 +372,6 @@ def almoxarifado():
         flash("Acesso negado!", "danger")
         return redirect(url_for("home"))
 
-    try:
-        kits_raw = manager.listar_registros(models.Kit) or []
-        estoque_raw = manager.listar_registros(models.EstoqueItem) or []
-        colaboradores_raw = manager.listar_registros(models.Colaborador) or []
-    except Exception:
-        kits_raw, estoque_raw, colaboradores_raw = [], [], []
-
-    kits = [flatten_record(k) for k in kits_raw]
-    estoque = [flatten_record(e) for e in estoque_raw]
-    colaboradores = [flatten_record(c) for c in colaboradores_raw]
-
-    kit_catalog, nomes_kits_ordenados = load_kit_catalog_csv()
-
-    # Mapa auxiliar nome_kit -> id_kit
-    kits_map = {}
-    for e in estoque:
-        nomek = (e.get("nome_kit") or "").strip()
-        idk = (e.get("id_kit") or "").strip()
-        if nomek and idk and nomek not in kits_map:
-            kits_map[nomek] = idk
-
     if request.method == "POST":
 
         # ADICIONAR item de estoque
@@ -350,11 +410,25 @@ def almoxarifado():
 
         return redirect(url_for("almoxarifado"))
 
+    pag_estoque = paginar(models.EstoqueItem, "e", {
+        "id_item": "ID", "item": "Item", "nome_kit": "Nome do Kit", "tamanho_camisa": "Tamanho", "qntd": "Quantidade",
+    }, "estoque")
+    pag_colaboradores = paginar(models.Colaborador, "c", {
+        "id_colaborador": "ID", "nome_colaborador": "Nome", "nome_kit": "Kit", "tamanho_camisa": "Tamanho",
+        "data_admissao": "Admissão", "situacao": "Situação",
+    }, "colaboradores")
+
+    kit_catalog, nomes_kits_ordenados = load_kit_catalog_csv()
+
+    # Mapa auxiliar nome_kit -> id_kit
+    kits_map = {nome: ref["id_kit"] for nome, ref in kit_catalog.items() if ref.get("id_kit")}
+
     return render_template(
         "almoxarifado.html",
-        kits=kits,
-        estoque=estoque,
-        colaboradores=colaboradores,
+        estoque=pag_estoque["itens"],
+        colaboradores=pag_colaboradores["itens"],
+        pag_estoque=pag_estoque,
+        pag_colaboradores=pag_colaboradores,
         kits_map=kits_map,
         kit_catalog=kit_catalog,
         nomes_kits_ordenados=nomes_kits_ordenados
@@ -383,13 +457,6 @@ def gestor():
     if not acesso_permitido(["Gestor"]):
         flash("Acesso negado!", "danger")
         return redirect(url_for("home"))
-    try:
-        colaboradores_raw = manager.listar_registros(models.Colaborador) or []
-    except Exception:
-        colaboradores_raw = []
-
-    colaboradores = [flatten_record(c) for c in colaboradores_raw]
-
     u = session.get("usuario", {})
     perfil = (u.get("nome_classe") or "").strip()
     my_id = normalize(u.get("id_usuario"))
@@ -408,18 +475,14 @@ def gestor():
             (my_login and nomeg and nomeg == my_login)
         )
 
-    if perfil == "Gestor":
-        colaboradores = [c for c in colaboradores if is_my_collab(c)]
-
     if request.method == "POST":
         if "nova_situacao" in request.form:
             id_colab = request.form["id_colaborador"]
             nova_situacao = request.form["nova_situacao"]
 
             if perfil == "Gestor":
-                all_cols = [flatten_record(x) for x in (manager.listar_registros(models.Colaborador) or [])]
-                alvo = next((r for r in all_cols if normalize(r.get("id_colaborador")) == normalize(id_colab)), None)
-                if not alvo or not is_my_collab(alvo):
+                alvo = manager.obter_registro(models.Colaborador, normalize(id_colab))
+                if not alvo or not is_my_collab(flatten_record(alvo)):
                     flash("Você não pode alterar colaboradores de outro gestor.", "danger")
                     return redirect(url_for("gestor"))
 
@@ -432,9 +495,8 @@ def gestor():
             id_colab = request.form["id_colaborador"]
 
             if perfil == "Gestor":
-                all_cols = [flatten_record(x) for x in (manager.listar_registros(models.Colaborador) or [])]
-                alvo = next((r for r in all_cols if normalize(r.get("id_colaborador")) == normalize(id_colab)), None)
-                if not alvo or not is_my_collab(alvo):
+                alvo = manager.obter_registro(models.Colaborador, normalize(id_colab))
+                if not alvo or not is_my_collab(flatten_record(alvo)):
                     flash("Você não pode remover colaboradores de outro gestor.", "danger")
                     return redirect(url_for("gestor"))
 
@@ -443,7 +505,21 @@ def gestor():
             flash("Colaborador removido!", "success")
             return redirect(url_for("gestor"))
 
-    return render_template("gestor.html", colaboradores=colaboradores)
+    # Gestor só enxerga a própria equipe: o filtro roda sobre as linhas cruas, antes de montar objetos
+    situacao = normalize(request.args.get("g_situacao")).lower()
+
+    def filtro(rec: dict) -> bool:
+        if situacao and normalize(rec.get("situacao")).lower() != situacao:
+            return False
+        return perfil != "Gestor" or is_my_collab(rec)
+
+    pag = paginar(models.Colaborador, "g", {
+        "id_colaborador": "ID", "nome_colaborador": "Nome", "email_colaborador": "Email", "nome_gestor": "GA",
+        "nome_kit": "Kit", "tamanho_camisa": "Tamanho", "data_admissao": "Data Admissão", "situacao": "Situação",
+    }, "colaboradores", where=filtro if situacao or perfil == "Gestor" else None)
+    pag.update(situacao=situacao, filtrado=pag["filtrado"] or bool(situacao))
+
+    return render_template("gestor.html", colaboradores=pag["itens"], pag_colaboradores=pag)
 
 
 # ---------------- RH ----------------
@@ -453,23 +529,6 @@ def rh():
         flash("Acesso negado!", "danger")
         return redirect(url_for("home"))
 
-    try:
-        usuarios_raw = manager.listar_registros(models.Usuario) or []
-        colaboradores_raw = manager.listar_registros(models.Colaborador) or []
-        kits_raw = manager.listar_registros(models.Kit) or []
-        estoque_raw = manager.listar_registros(models.EstoqueItem) or []
-        agencias_raw = manager.listar_registros(models.Agencia) or []
-    except Exception:
-        usuarios_raw, colaboradores_raw, kits_raw, estoque_raw, agencias_raw = [], [], [], [], []
-
-    usuarios = [flatten_record(u) for u in usuarios_raw]
-    colaboradores = [flatten_record(c) for c in colaboradores_raw]
-    kits = [flatten_record(k) for k in kits_raw]
-    estoque = [flatten_record(e) for e in estoque_raw]
-    agencias = [flatten_record(a) for a in agencias_raw]
-
-    class_map = build_class_map(usuarios)
-
     if request.method == "POST":
         # ---- Usuários ----
         if "adicionar_usuario" in request.form:
@@ -623,17 +682,239 @@ def rh():
 
         return redirect(url_for("rh"))
 
+    # Só a página pedida de cada aba é convertida e renderizada
+    pag_usuarios = paginar(models.Usuario, "u", {
+        "id_usuario": "ID", "usuario": "Login", "nome": "Nome", "email": "Email", "nome_classe": "Classe",
+    }, "usuarios")
+    pag_colaboradores = paginar(models.Colaborador, "c", {
+        "id_colaborador": "ID", "nome_colaborador": "Nome", "email_colaborador": "Email",
+        "nome_gestor": "Nome GA", "email_gestor": "Email GA", "id_kit": "ID Kit", "nome_kit": "Nome Kit",
+        "data_admissao": "Data Admissão", "tamanho_camisa": "Tam. Camisa", "id_agencia": "ID Agência",
+        "situacao": "Situação",
+    }, "colaboradores")
+    pag_estoque = paginar(models.EstoqueItem, "e", {
+        "id_item": "ID", "item": "Item", "tamanho_camisa": "Tamanho", "qntd": "Quantidade",
+    }, "estoque")
+    pag_kits = paginar(models.Kit, "k", {
+        "id_kit": "ID", "nome_kit": "Nome Kit", "item": "Item", "tamanho_camisa": "Tamanho",
+    }, "kits")
+
+    try:
+        class_map = build_class_map(manager.iter_registros(models.Usuario, fields=["nome_classe", "id_classe"]))
+        kits_opcoes = [{"id_kit": id_kit, "nome_kit": k["nome_kit"]} for id_kit, k in manager.kit_bom().items()]
+        agencias = [flatten_record(a) for a in manager.listar_registros(models.Agencia)]
+    except Exception:
+        class_map, kits_opcoes, agencias = build_class_map([]), [], []
+
     return render_template(
         "rh.html",
-        usuarios=usuarios,
-        colaboradores=colaboradores,
-        kits=kits,
-        estoque=estoque,
+        usuarios=pag_usuarios["itens"],
+        colaboradores=pag_colaboradores["itens"],
+        kits=pag_kits["itens"],
+        estoque=pag_estoque["itens"],
+        pag_usuarios=pag_usuarios,
+        pag_colaboradores=pag_colaboradores,
+        pag_kits=pag_kits,
+        pag_estoque=pag_estoque,
+        kits_opcoes=kits_opcoes,
         agencias=agencias,
         class_map=class_map,
     )
 
 
+# ---------------- AUDITORIA ----------------
+# Log de ações consultado pelos índices do manager; filtros com prefixo "l" para a paginação de _tabela.html.
+FILTROS_AUDITORIA = ("usuario", "acao", "id", "inicio", "fim")
+
+
+@app.route("/auditoria")
+def auditoria():
+    if not acesso_permitido([]):
+        flash("Acesso negado!", "danger")
+        return redirect(url_for("home"))
+    args = request.args
+    filtros = {nome: normalize(args.get(f"l_{nome}")) for nome in FILTROS_AUDITORIA}
+    por_pagina = args.get("l_por", POR_PAGINA_PADRAO, type=int)
+    if por_pagina not in POR_PAGINA_OPCOES:
+        por_pagina = POR_PAGINA_PADRAO
+    pag = manager.consultar_log(
+        usuario=filtros["usuario"] or None, acao=filtros["acao"] or None, id_registro=filtros["id"] or None,
+        inicio=filtros["inicio"] or None, fim=filtros["fim"] or None,
+        pagina=args.get("l_pagina", 1, type=int), por_pagina=por_pagina,
+    )
+    pag.update(prefixo="l", aba="log", filtros=filtros, filtrado=any(filtros.values()))
+    return render_template("auditoria.html", pag=pag, opcoes=manager.opcoes_log())
+
+
+# ---------------- MÉTRICAS ----------------
+@app.route("/metrics")
+def metricas():
+    """Contadores e tempos no formato de texto do Prometheus (404 com as métricas desligadas)."""
+    if not metrics.ativo():
+        return "Métricas desligadas; ligue com KITS_METRICAS=1\n", 404, {"Content-Type": "text/plain; charset=utf-8"}
+    return metrics.prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+# ======================= API JSON =======================
+# Um recurso por tabela de MODEL_FILE_MAP (nome do arquivo sem .csv), autenticado pela sessão.
+
+API_MODELOS = {os.path.splitext(arquivo)[0]: modelo for modelo, arquivo in manager.MODEL_FILE_MAP.items()}
+API_CAMPOS_OCULTOS = {"senha"}
+API_LIMITE_PADRAO = 100
+API_LIMITE_MAXIMO = 1000
+
+
+def api_erro(mensagem, status=400):
+    return jsonify({"erro": mensagem}), status
+
+
+def api_modelo(recurso):
+    """(modelo, None) ou (None, resposta de erro) conforme sessão, perfil e recurso."""
+    if "usuario" not in session:
+        return None, api_erro("Não autenticado.", 401)
+    if not acesso_permitido(["RH"]):
+        return None, api_erro("Acesso negado!", 403)
+    modelo = API_MODELOS.get(recurso)
+    if modelo is None:
+        return None, api_erro(f"Recurso desconhecido: {recurso}", 404)
+    return modelo, None
+
+
+def api_campos(modelo):
+    """Colunas pedidas em ?campos=a,b (padrão: todas as visíveis)."""
+    visiveis = [f.name for f in fields(modelo) if f.name not in API_CAMPOS_OCULTOS]
+    pedidos = [c.strip() for c in request.args.get("campos", "").split(",") if c.strip()]
+    invalidos = [c for c in pedidos if c not in visiveis]
+    if invalidos:
+        raise ValueError(f"Campos inválidos: {', '.join(invalidos)}")
+    return pedidos or visiveis
+
+
+def api_linha(linha):
+    """Linha no mesmo formato da listagem (texto, como gravado), sem campos ocultos."""
+    return {k: normalize(v) for k, v in (linha or {}).items() if k not in API_CAMPOS_OCULTOS}
+
+
+API_TIPOS = {models._inteiro: (int, "número inteiro esperado"), models._data: (date, "data AAAA-MM-DD esperada")}
+
+
+def api_valor(campo, conversor, valor):
+    """Valor do JSON no tipo do campo (conversores de models): inteiro, data ISO ou texto."""
+    if valor is None or valor == "":
+        return None if conversor in API_TIPOS else ""
+    if conversor in API_TIPOS:
+        tipo, esperado = API_TIPOS[conversor]
+        convertido = conversor(valor) if isinstance(valor, str) or type(valor) is int else None
+        if not isinstance(convertido, tipo):
+            raise ValueError(f"{campo}: {esperado}, recebido {valor!r}.")
+        return convertido
+    if not isinstance(valor, str):
+        raise ValueError(f"{campo}: texto esperado, recebido {valor!r}.")
+    return valor
+
+
+def api_dados(modelo):
+    """Campos do corpo JSON convertidos para o tipo do modelo; ValueError (400) antes de chegar ao manager."""
+    dados = request.get_json(silent=True)
+    if not isinstance(dados, dict):
+        raise ValueError("Corpo JSON (objeto) obrigatório.")
+    nomes = {f.name for f in fields(modelo)}
+    invalidos = [k for k in dados if k not in nomes]
+    if invalidos:
+        raise ValueError(f"Campos inválidos: {', '.join(invalidos)}")
+    return {campo: api_valor(campo, conversor, dados[campo]) for campo, conversor in models._esquema(modelo) if campo in dados}
+
+
+@app.route("/api/<recurso>", methods=["GET"])
+def api_listar(recurso):
+    """
+    Listagem incremental: ?cursor=<última chave recebida>&limite=N&campos=a,b.
+    A resposta traz `proximo_cursor` (null quando não há mais registros).
+    """
+    modelo, erro = api_modelo(recurso)
+    if erro:
+        return erro
+    limite = min(max(1, request.args.get("limite", API_LIMITE_PADRAO, type=int)), API_LIMITE_MAXIMO)
+    try:
+        registros, proximo = manager.listar_por_cursor(
+            modelo, cursor=request.args.get("cursor"), limite=limite, fields=api_campos(modelo))
+    except ValueError as e:
+        return api_erro(str(e))
+    return jsonify({"registros": registros, "proximo_cursor": proximo})
+
+
+@app.route("/api/<recurso>/<id_registro>", methods=["GET"])
+def api_obter(recurso, id_registro):
+    modelo, erro = api_modelo(recurso)
+    if erro:
+        return erro
+    try:
+        campos = api_campos(modelo)
+    except ValueError as e:
+        return api_erro(str(e))
+    chave = manager.MODEL_ID_KEY[modelo]
+    registro = next(manager.iter_registros(modelo, where={chave: id_registro}, fields=campos), None)
+    if registro is None:
+        return api_erro(f"{chave} {id_registro} não encontrado.", 404)
+    return jsonify({"registro": registro})
+
+
+@app.route("/api/<recurso>", methods=["POST"])
+def api_criar(recurso):
+    modelo, erro = api_modelo(recurso)
+    if erro:
+        return erro
+    try:
+        novo = modelo(**api_dados(modelo))
+        with manager.transaction():
+            resultado = manager.adicionar_registro(novo, modelo)
+            manager.log_action(usuario_atual(), resultado)
+    except (TypeError, ValueError) as e:
+        return api_erro(str(e))
+    return jsonify({"registro": api_linha(resultado["linha_depois"])}), 201
+
+
+@app.route("/api/<recurso>/<id_registro>", methods=["PUT", "PATCH"])
+def api_atualizar(recurso, id_registro):
+    """PATCH altera só os campos enviados; PUT substitui o registro e exige todos. A chave primária não muda."""
+    modelo, erro = api_modelo(recurso)
+    if erro:
+        return erro
+    chave = manager.MODEL_ID_KEY[modelo]
+    if manager.obter_registro(modelo, id_registro) is None:
+        return api_erro(f"{chave} {id_registro} não encontrado.", 404)
+    try:
+        dados = api_dados(modelo)
+        if dados.pop(chave, id_registro) != id_registro:
+            raise ValueError(f"{chave} não pode ser alterado.")
+        faltando = [f.name for f in fields(modelo) if f.name != chave and f.name not in dados]
+        if request.method == "PUT" and faltando:
+            raise ValueError(f"PUT exige todos os campos; faltando: {', '.join(faltando)}")
+        with manager.transaction():
+            resultado = manager.atualizar_registro(chave, id_registro, dados, modelo)
+            manager.log_action(usuario_atual(), resultado)
+    except ValueError as e:
+        return api_erro(str(e))
+    return jsonify({"registro": api_linha(resultado["linha_depois"])})
+
+
+@app.route("/api/<recurso>/<id_registro>", methods=["DELETE"])
+def api_remover(recurso, id_registro):
+    modelo, erro = api_modelo(recurso)
+    if erro:
+        return erro
+    chave = manager.MODEL_ID_KEY[modelo]
+    if manager.obter_registro(modelo, id_registro) is None:
+        return api_erro(f"{chave} {id_registro} não encontrado.", 404)
+    try:
+        with manager.transaction():
+            resultado = manager.remover_registro(chave, id_registro, modelo)
+            manager.log_action(usuario_atual(), resultado)
+    except ValueError as e:
+        return api_erro(str(e))
+    return jsonify({"removido": api_linha(resultado["linha_antes"])})
+
+
 # ======================= BOOTSTRAP APP =======================
 
 def run_app():
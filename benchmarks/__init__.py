@@ -0,0 +1 @@
+"""Benchmarks do manager e das rotas Flask: python -m benchmarks --help"""
@@ -0,0 +1,185 @@
+"""
+Mede latência e vazão das operações do manager e das rotas Flask sobre dados
+sintéticos (benchmarks/gerador.py) em várias escalas e grava o resultado em
+JSON, para comparar commits:
+
+    python -m benchmarks --escalas 100,10000 --saida antes.json
+    python -m benchmarks --escalas 100,10000 --comparar antes.json
+
+O motor padrão é o em memória (sem disco nem criptografia); com --motor csv ou
+sqlite os dados vão para um diretório temporário, nunca para data/.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+MOTORES = ["memoria", "csv", "sqlite"]
+ESCALAS_PADRAO = "100,10000,100000"
+LINHAS_PLANILHA = 1000
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks do manager e das rotas Flask")
+    parser.add_argument("--escalas", default=ESCALAS_PADRAO, help=f"Colaboradores por rodada (padrão: {ESCALAS_PADRAO})")
+    parser.add_argument("--motor", default="memoria", choices=MOTORES, help="Motor de armazenamento (padrão: memoria)")
+    parser.add_argument("--iteracoes", type=int, default=200, help="Máximo de chamadas por operação (padrão: 200)")
+    parser.add_argument("--tempo", type=float, default=5.0, help="Segundos máximos por operação (padrão: 5)")
+    parser.add_argument("--operacoes", help="Só as operações cujo nome contenha um destes textos (separados por vírgula)")
+    parser.add_argument("--semente", type=int, default=42, help="Semente do gerador de dados (padrão: 42)")
+    parser.add_argument("--saida", help="Arquivo JSON para gravar o resultado (padrão: só imprime)")
+    parser.add_argument("--comparar", metavar="BASE", help="JSON de uma execução anterior para comparar")
+    return parser.parse_args()
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _carregar(manager, motor, dados):
+    """Instala os dados sintéticos no motor, do zero (tabelas e sequências de id)."""
+    if motor == "memoria":
+        manager.usar_motor(motor, tabelas=dados)
+        return
+    manager.usar_motor(motor)
+    manager.motor().gravar({m: (None, linhas) for m, linhas in dados.items()})
+    manager.motor().gravar_segmento(manager.SEQUENCE_FILE, b"{}")
+    manager.invalidar_cache()
+
+
+def _operacoes(manager, models, app, dados, planilha):
+    """{nome: função(i)}; a importação fica por último porque substitui a tabela de colaboradores."""
+    Colaborador, Kit = models.Colaborador, models.Kit
+    colaboradores = dados[Colaborador]
+    gestores = [u["id_usuario"] for u in dados[models.Usuario] if u["nome_classe"] == "Gestor"]
+    kit = dados[Kit][0]
+    agencias = [a["id_agencia"] for a in dados[models.Agencia]]
+
+    def adicionar(i):
+        novo = Colaborador(nome_colaborador=f"Bench {i}", id_gestor=gestores[i % len(gestores)], id_kit=kit["id_kit"],
+                           tamanho_camisa=kit["tamanho_camisa"], id_agencia=agencias[i % len(agencias)], situacao="montar")
+        manager.adicionar_registro(novo, Colaborador)
+
+    def atualizar(i):
+        alvo = colaboradores[(i * 7919) % len(colaboradores)]["id_colaborador"]
+        manager.atualizar_registro("id_colaborador", alvo, {"situacao": ("montar", "enviado", "entregue")[i % 3]}, Colaborador)
+
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["usuario"] = {"id": "U001", "usuario": "admin", "nome": "Administrador",
+                             "id_classe": "1", "nome_classe": "Administrador"}
+
+    def rota(url):
+        def get(i):
+            resposta = cliente.get(url)
+            if resposta.status_code != 200:
+                raise RuntimeError(f"GET {url}: HTTP {resposta.status_code}")
+        return get
+
+    return {
+        "read_csv": lambda i: manager.read_csv(Colaborador),
+        "paginar_registros": lambda i: manager.paginar_registros(
+            Colaborador, busca={"nome_colaborador": "silva"}, ordem="data_admissao", pagina=1 + i % 5),
+        "validar_estoque_para_kit": lambda i: manager.validar_estoque_para_kit(kit["id_kit"], kit["tamanho_camisa"]),
+        "adicionar_registro": adicionar,
+        "atualizar_registro": atualizar,
+        "log_action": lambda i: manager.log_action("benchmark", {
+            "acao": "ATUALIZAR", "linha_antes": colaboradores[0], "linha_depois": colaboradores[0]}),
+        "GET /rh": rota("/rh"),
+        "GET /gestor": rota("/gestor"),
+        "GET /almoxarifado": rota("/almoxarifado"),
+        "GET /api/colaboradores": rota("/api/colaboradores?limite=100"),
+        "importar_colaboradores": lambda i: manager.importar_colaboradores(planilha, "benchmark"),
+    }
+
+
+def _medir(funcao, iteracoes, tempo_max):
+    funcao(-1)  # aquecimento: cache de tabelas, índices e templates
+    tempos, limite = [], time.perf_counter() + tempo_max
+    for i in range(iteracoes):
+        inicio = time.perf_counter()
+        funcao(i)
+        fim = time.perf_counter()
+        tempos.append(fim - inicio)
+        if fim > limite:
+            break
+    tempos.sort()
+    total = sum(tempos)
+    percentil = lambda p: tempos[min(len(tempos) - 1, int(p * len(tempos)))] * 1000
+    return {
+        "chamadas": len(tempos),
+        "total_s": round(total, 6),
+        "ops_s": round(len(tempos) / total, 2) if total else None,
+        "media_ms": round(total / len(tempos) * 1000, 4),
+        "p50_ms": round(percentil(0.50), 4),
+        "p95_ms": round(percentil(0.95), 4),
+        "max_ms": round(tempos[-1] * 1000, 4),
+    }
+
+
+def _comparar(base, atual):
+    anteriores = {(r["escala"], r["operacao"]): r for r in base["resultados"]}
+    print(f"\nComparação com {base['meta'].get('commit') or 'base'} (p50 em ms; razão < 1 = mais rápido)")
+    print(f"{'escala':>8}  {'operação':<26}{'base':>12}{'atual':>12}{'razão':>9}")
+    for r in atual["resultados"]:
+        anterior = anteriores.get((r["escala"], r["operacao"]))
+        if anterior is None:
+            continue
+        razao = r["p50_ms"] / anterior["p50_ms"] if anterior["p50_ms"] else float("nan")
+        print(f"{r['escala']:>8}  {r['operacao']:<26}{anterior['p50_ms']:>12.3f}{r['p50_ms']:>12.3f}{razao:>9.2f}")
+
+
+def main():
+    args = _argumentos()
+    escalas = [int(e) for e in args.escalas.split(",") if e.strip()]
+    filtros = [f.strip() for f in (args.operacoes or "").split(",") if f.strip()]
+    # antes de importar utils: o motor e o diretório de dados são lidos na importação
+    os.environ["KITS_MOTOR"] = args.motor
+    if args.motor != "memoria":
+        os.environ["KITS_DATA_DIR"] = tempfile.mkdtemp(prefix="kits-bench-")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from utils import manager, models
+    from app import app
+    from benchmarks.gerador import gerar_dados, gerar_planilha
+
+    resultado = {
+        "meta": {
+            "commit": _commit(), "data": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "plataforma": platform.platform(),
+            "motor": args.motor, "iteracoes": args.iteracoes, "tempo_max_s": args.tempo, "semente": args.semente,
+        },
+        "resultados": [],
+    }
+    for escala in escalas:
+        dados = gerar_dados(escala, args.semente)
+        planilha = gerar_planilha(dados, min(escala, LINHAS_PLANILHA), args.semente)
+        _carregar(manager, args.motor, dados)
+        for nome, funcao in _operacoes(manager, models, app, dados, planilha).items():
+            if filtros and not any(f in nome for f in filtros):
+                continue
+            medida = {"escala": escala, "operacao": nome, **_medir(funcao, args.iteracoes, args.tempo)}
+            resultado["resultados"].append(medida)
+            print(f"{escala:>8}  {nome:<26}{medida['chamadas']:>6} chamadas  p50 {medida['p50_ms']:>10.3f} ms  "
+                  f"p95 {medida['p95_ms']:>10.3f} ms  {medida['ops_s'] or 0:>10.1f} ops/s", file=sys.stderr)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            _comparar(json.load(f), resultado)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Dados sintéticos no formato de backup/*.csv, em qualquer escala: agências,
+gestores, kits (camisas por tamanho + brindes), estoque espelhando os kits e
+colaboradores. Determinístico para a mesma semente, para comparar commits.
+"""
+import random
+from datetime import date, timedelta
+
+from utils.models import Agencia, Colaborador, EstoqueItem, Kit, Usuario
+
+NOMES = ["Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela",
+         "João", "Larissa", "Marcos", "Natália", "Otávio", "Paula", "Rafael", "Sabrina", "Tiago"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Costa", "Almeida",
+              "Ferreira", "Rodrigues", "Gomes", "Martins", "Araújo", "Ribeiro", "Carvalho"]
+CIDADES = [("SÃO PAULO", "SP"), ("CAMPINAS", "SP"), ("RIO DE JANEIRO", "RJ"), ("BELO HORIZONTE", "MG"),
+           ("CURITIBA", "PR"), ("PORTO ALEGRE", "RS"), ("SALVADOR", "BA"), ("RECIFE", "PE"),
+           ("FORTALEZA", "CE"), ("BELÉM", "PA"), ("MANAUS", "AM"), ("GOIÂNIA", "GO"), ("BRASÍLIA", "DF")]
+CARGOS = ["Analista", "Assistente", "Coordenador", "Gerente", "Especialista", "Estagiário"]
+SITUACOES = ["montar", "enviado", "entregue"]
+TAMANHOS = ["PP", "P", "M", "G", "GG"]
+BRINDES = ["caneta", "caneca", "caderno", "mochila"]
+
+
+def _nome(rnd):
+    return f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)}"
+
+
+def _email(nome, n):
+    return f"{nome.lower().replace(' ', '.')}{n}@safra.com.br"
+
+
+def gerar_dados(colaboradores: int, semente: int = 42) -> dict:
+    """{model: linhas (dicts de texto)} com `colaboradores` colaboradores e o resto proporcional."""
+    rnd = random.Random(semente)
+    n_agencias = max(99, colaboradores // 100)
+    n_gestores = max(5, colaboradores // 50)
+    n_kits = 2 + colaboradores // 10000
+
+    agencias = []
+    for i in range(1, n_agencias + 1):
+        cidade, uf = rnd.choice(CIDADES)
+        agencias.append({"id_agencia": f"A{i:03d}", "cidade_envio": cidade, "uf_envio": uf,
+                         "prazo_dias": str(rnd.randint(2, 10))})
+
+    usuarios = [{"id_usuario": "U001", "usuario": "admin", "senha": "senha123", "nome": "Administrador",
+                 "email": "admin@safra.com.br", "id_classe": "1", "nome_classe": "Administrador"}]
+    for i in range(2, n_gestores + 2):
+        nome = _nome(rnd)
+        usuarios.append({"id_usuario": f"U{i:03d}", "usuario": f"gestor{i}", "senha": "senha123", "nome": nome,
+                         "email": _email(nome, i), "id_classe": "2", "nome_classe": "Gestor"})
+
+    kits, estoque, tamanhos_kit = [], [], {}
+    for k in range(1, n_kits + 1):
+        id_kit, nome_kit = f"K{k:03d}", f"kit{k}"
+        tamanhos_kit[id_kit] = TAMANHOS if k % 2 == 0 else TAMANHOS[1:4]
+        itens = [(f"camisa {nome_kit}", t, 3) for t in tamanhos_kit[id_kit]]
+        itens += [(f"{brinde} {nome_kit}", "NA", 1) for brinde in BRINDES]
+        for item, tamanho, qntd in itens:
+            id_item = f"E{len(estoque) + 1:03d}"
+            kits.append({"id_kit": id_kit, "nome_kit": nome_kit, "id_item": id_item, "item": item,
+                         "tamanho_camisa": tamanho, "qntd": str(qntd)})
+            # folga para as operações do benchmark nunca esbarrarem em estoque insuficiente
+            estoque.append({"id_item": id_item, "item": item, "tamanho_camisa": tamanho, "id_kit": id_kit,
+                            "nome_kit": nome_kit, "qntd": str(10 * colaboradores + 10000)})
+
+    inicio = date(2023, 1, 1)
+    linhas_colab = []
+    for i in range(1, colaboradores + 1):
+        nome, gestor, kit, agencia = _nome(rnd), rnd.choice(usuarios[1:]), rnd.choice(kits), rnd.choice(agencias)
+        linhas_colab.append({
+            "id_colaborador": f"C{i:03d}", "nome_colaborador": nome, "email_colaborador": _email(nome, i),
+            "id_gestor": gestor["id_usuario"], "nome_gestor": gestor["nome"], "email_gestor": gestor["email"],
+            "id_kit": kit["id_kit"], "nome_kit": kit["nome_kit"],
+            "data_admissao": (inicio + timedelta(days=rnd.randint(0, 1000))).isoformat(),
+            "tamanho_camisa": rnd.choice(tamanhos_kit[kit["id_kit"]]),
+            "id_agencia": agencia["id_agencia"], "cidade_envio": agencia["cidade_envio"], "uf_envio": agencia["uf_envio"],
+            "situacao": rnd.choice(SITUACOES), "id_registro": f"{i:06d}", "cargo": rnd.choice(CARGOS),
+        })
+
+    return {Agencia: agencias, Usuario: usuarios, Kit: kits, EstoqueItem: estoque, Colaborador: linhas_colab}
+
+
+def gerar_planilha(dados: dict, linhas: int, semente: int = 7) -> list:
+    """Linhas da planilha de admissões (formato de importar_colaboradores), com gestores e kits já cadastrados."""
+    rnd = random.Random(semente)
+    gestores = [u for u in dados[Usuario] if u["nome_classe"] == "Gestor"]
+    kits = sorted({(k["id_kit"], k["nome_kit"]) for k in dados[Kit]})
+    planilha = []
+    for i in range(1, linhas + 1):
+        nome, agencia = _nome(rnd), rnd.choice(dados[Agencia])
+        planilha.append({
+            "ID": str(900000 + i), "Nome": nome, "E-mail": _email(nome, i), "Cargo": rnd.choice(CARGOS),
+            "Data Adimissão": (date(2024, 1, 1) + timedelta(days=rnd.randint(0, 365))).isoformat(),
+            "Superior Imediato": rnd.choice(gestores)["nome"], "Kit": rnd.choice(kits)[1],
+            "Tamanho Camisa": rnd.choice(TAMANHOS), "Local de Trabalho": agencia["id_agencia"],
+            "Estado": agencia["uf_envio"],
+        })
+    return planilha
@@ -1,26 +1,8 @@
-import os, csv, argparse
+import argparse
 from utils import manager, models
 
 usuario_teste = "script_teste"
 
-def imprimir_log_formatado():
-    from utils.manager import DATA_DIR
-    manager.restore_data()    
-    log_file = os.path.join(DATA_DIR, "logs.csv")
-    if not os.path.exists(log_file):
-        print("\n[LOG] Nenhum log encontrado.")
-        return
-
-    print("\n===== LOG DE AÇÕES =====")
-    with open(log_file, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for i, row in enumerate(reader, start=1):
-            print(f"\n#{i} [{row['data']} {row['hora']}] usuário={row['usuario']} ação={row['acao']}")
-            print("  - Antes :", row["linha_antes"])
-            print("  - Depois:", row["linha_depois"])
-    print("========================\n")
-    manager.backup_data()
-
 def teste_crud(entidade, chave, dados_iniciais, dados_atualizados):
     print(f"\n# --- TESTE {entidade.__name__.upper()} --- #")
 
@@ -44,7 +26,7 @@ def teste_crud(entidade, chave, dados_iniciais, dados_atualizados):
     input("Continuar...")
 
     # 3. Buscar
-    encontrado = next((r for r in manager.listar_registros(entidade) if getattr(r, chave) == valor_chave), None)
+    encontrado = next(manager.iter_registros(entidade, where={chave: valor_chave}), None)
     print("Busca:", encontrado)
     input("Continuar...")
 
@@ -121,6 +103,22 @@ def teste_usuarios():
     )
 
 
+def teste_cursor():
+    """listar_por_cursor atravessa a virada C999 -> C1000 sem pular registros (motor em memória, nada no disco)."""
+    manager.usar_motor("memoria", tabelas={
+        models.Colaborador: [models.Colaborador(id_colaborador=f"C{n}", nome_colaborador=f"Teste {n}") for n in range(995, 1003)]})
+    vistos, cursor = [], None
+    while True:
+        registros, cursor = manager.listar_por_cursor(models.Colaborador, cursor=cursor, limite=3)
+        vistos += [r.id_colaborador for r in registros]
+        if cursor is None:
+            break
+    esperados = [f"C{n}" for n in range(995, 1003)]
+    assert vistos == esperados, vistos
+    assert manager.listar_por_cursor(models.Colaborador, cursor="C999")[0][0].id_colaborador == "C1000"
+    print("Cursor OK:", " ".join(vistos))
+
+
 def main(debug=False):
     if debug:
         print(">>> DEBUG MODE ATIVO <<<")
@@ -132,7 +130,7 @@ def main(debug=False):
         teste_estoque()
         teste_kits()
         teste_usuarios()
-        imprimir_log_formatado()
+        manager.imprimir_log_formatado()
         pass
     
 
@@ -143,5 +141,30 @@ if __name__ == "__main__":
         action="store_true",
         help="Executa o programa em modo debug"
     )
+    parser.add_argument(
+        "--migrar-motor",
+        metavar="DESTINO",
+        choices=sorted(n for n, motor in manager.MOTORES.items() if motor.persistente),
+        help="Copia todas as tabelas do motor de origem (--de) para DESTINO e sai"
+    )
+    parser.add_argument(
+        "--de",
+        default="csv",
+        choices=sorted(n for n, motor in manager.MOTORES.items() if motor.persistente),
+        help="Motor de origem da migração (padrão: csv)"
+    )
+    parser.add_argument(
+        "--teste-cursor",
+        action="store_true",
+        help="Verifica a listagem por cursor na virada de C999 para C1000 (em memória) e sai"
+    )
     args = parser.parse_args()
-    main(debug=args.debug)
\ No newline at end of file
+    if args.teste_cursor:
+        teste_cursor()
+    elif args.migrar_motor:
+        copiadas = manager.migrar_motor(args.de, args.migrar_motor)
+        for arquivo, total in copiadas.items():
+            print(f"{arquivo}: {total} linha(s)")
+        print(f"Migração concluída. Use KITS_MOTOR={args.migrar_motor} para rodar com o novo motor.")
+    else:
+        main(debug=args.debug)
\ No newline at end of file
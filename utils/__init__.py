@@ -1,7 +1,9 @@
 import os
-from . import secure_backup, manager, models
+from . import metrics, secure_backup, manager, models
 
 def _init_secure_data():
+    if os.environ.get("KITS_MOTOR") == manager.MotorMemoria.nome:
+        return  # motor em memória: nada de chave nem de backup dos CSVs em disco
     secure_backup.generate_key()
     data_dir = secure_backup.DATA_DIR
     csvs = [f for f in os.listdir(data_dir) if f.endswith(".csv")]
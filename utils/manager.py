@@ -1,15 +1,28 @@
+import ast
 import csv
+import heapq
+import io
+import json
 import os
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from contextlib import contextmanager
 from dataclasses import asdict, fields
 from typing import List, Type
 import getpass
 
 from datetime import datetime
-from .secure_backup import restore_data, backup_data
-from .models import Agencia, Colaborador, EstoqueItem, Kit, Usuario
+from .secure_backup import (
+    read_table, read_table_versioned, write_table, write_tables, delete_table,
+    table_generation, append_log, log_periods, log_size, read_log_from, split_log, TRAVA,
+)
+from . import metrics
+from .models import Agencia, Colaborador, EstoqueItem, Kit, Usuario, row_to_record, rows_to_records, record_to_row
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-DATA_DIR = os.path.join(BASE_DIR, "data")
+DATA_DIR = os.environ.get("KITS_DATA_DIR") or os.path.join(BASE_DIR, "data")
 
 
 # ---------------- DE PARA ARQUIVOS ---------------- #
@@ -34,325 +47,1263 @@ MODEL_ID_PREFIX = {
 }
 
 
+# ---------------- CHAVES PRIMÁRIAS ---------------- #
+
+MODEL_ID_KEY = {
+    Agencia: "id_agencia",
+    Colaborador: "id_colaborador",
+    EstoqueItem: "id_item",
+    Kit: "id_kit",
+    Usuario: "id_usuario",
+}
+
+
+# ---------------- TABELA INDEXADA ---------------- #
+
+class _Tabela:
+    """
+    Linhas de uma tabela com índices valor -> posições, criados sob demanda e
+    mantidos em dia a cada inserção, alteração e remoção. A chave de um índice
+    é o nome de uma coluna ou uma função linha -> chave (índices compostos).
+    Posições removidas viram None até a próxima gravação, para não deslocar
+    os índices.
+    """
+
+    def __init__(self, linhas, derivados=None):
+        self.linhas = linhas
+        self._indices = {}
+        self._derivados = dict(derivados or {})
+
+    def __iter__(self):
+        return (linha for linha in self.linhas if linha is not None)
+
+    def copia(self):
+        nova = _Tabela(list(self.linhas), self._derivados)
+        nova._indices = {c: (extrair, {v: list(p) for v, p in idx.items()}) for c, (extrair, idx) in list(self._indices.items())}
+        return nova
+
+    def derivado(self, montar):
+        """Estrutura calculada a partir da tabela inteira; descartada a cada alteração."""
+        if montar not in self._derivados:
+            self._derivados[montar] = montar(self)
+        return self._derivados[montar]
+
+    def indice(self, chave):
+        if chave not in self._indices:
+            extrair = chave if callable(chave) else (lambda linha, coluna=chave: linha.get(coluna, ""))
+            idx = {}
+            for pos, linha in enumerate(self.linhas):
+                if linha is not None:
+                    idx.setdefault(extrair(linha), []).append(pos)
+            self._indices[chave] = (extrair, idx)
+        return self._indices[chave][1]
+
+    def tem_indice(self, chave):
+        return chave in self._indices
+
+    def posicoes(self, chave, valor):
+        return list(self.indice(chave).get(valor, ()))
+
+    def inserir(self, linha):
+        pos = len(self.linhas)
+        self.linhas.append(linha)
+        self._derivados.clear()
+        for extrair, idx in self._indices.values():
+            idx.setdefault(extrair(linha), []).append(pos)
+
+    def atualizar(self, pos, novos):
+        antiga = self.linhas[pos]
+        nova = {**antiga, **novos}
+        self._derivados.clear()
+        for extrair, idx in self._indices.values():
+            if extrair(antiga) != extrair(nova):
+                self._desindexar(idx, extrair(antiga), pos)
+                insort(idx.setdefault(extrair(nova), []), pos)
+        self.linhas[pos] = nova
+
+    def remover(self, pos):
+        antiga = self.linhas[pos]
+        self.linhas[pos] = None
+        self._derivados.clear()
+        for extrair, idx in self._indices.values():
+            self._desindexar(idx, extrair(antiga), pos)
+
+    @staticmethod
+    def _desindexar(idx, valor, pos):
+        idx[valor].remove(pos)
+        if not idx[valor]:
+            del idx[valor]
+
+
+# ---------------- MOTORES DE ARMAZENAMENTO ---------------- #
+# Contrato: geracao(model) identifica a versão gravada da tabela; carregar(model)
+# devolve (geração, linhas como dicts de texto); gravar({model: (antes, depois)})
+# grava várias tabelas de uma vez, sob a trava de escrita. `antes` é o snapshot
+# lido pela transação (None = substituir a tabela inteira). Sequências de id e
+# log de auditoria também passam pelo motor: ler_segmento/gravar_segmento;
+# anexar_log([(período, registro)]), periodos_log(), e ler_log(período, desde),
+# que devolve (posição seguinte, registro) a partir de `desde`, com
+# tamanho_log(período) = posição do fim, para retomar a leitura de onde parou.
+
+class _MotorCifrado:
+    """Sequências e log nos segmentos cifrados do secure_backup (comum a csv e sqlite)."""
+
+    persistente = True
+
+    def ler_segmento(self, nome):
+        return read_table(nome)
+
+    def gravar_segmento(self, nome, conteudo: bytes):
+        write_table(nome, conteudo)
+
+    def anexar_log(self, registros):
+        if not registros: return
+        _migrar_logs()
+        por_periodo = defaultdict(list)
+        for periodo, registro in registros:
+            por_periodo[periodo].append(registro)
+        with TRAVA.escrita():
+            for periodo, lote in por_periodo.items():
+                append_log(lote, periodo)
+
+    def periodos_log(self):
+        _migrar_logs()
+        return log_periods()
+
+    def tamanho_log(self, periodo):
+        return log_size(periodo)
+
+    def ler_log(self, periodo, desde=0):
+        return read_log_from(periodo, desde)
+
+
+class MotorCSV(_MotorCifrado):
+    """Padrão: cada tabela é um CSV em um segmento cifrado próprio (secure_backup)."""
+
+    nome = "csv"
+
+    def geracao(self, model):
+        return table_generation(MODEL_FILE_MAP[model])
+
+    def carregar(self, model):
+        geracao, conteudo = read_table_versioned(MODEL_FILE_MAP[model])
+        return geracao, _parse_csv(conteudo)
+
+    def gravar(self, alteracoes: dict):
+        write_tables({MODEL_FILE_MAP[m]: _serializar_csv(m, depois) for m, (_, depois) in alteracoes.items()})
+
+
+class MotorSQLite(_MotorCifrado):
+    """
+    Todas as tabelas em um banco SQLite guardado inteiro dentro do envelope Fernet
+    (segmento SQLITE_SEGMENT), com índice nas colunas id_* (chaves e estrangeiras).
+    Uma gravação aplica só as linhas que mudaram (UPDATE/INSERT/DELETE) e cifra o
+    banco de novo. O banco decifrado fica em memória enquanto o segmento não mudar;
+    cada tabela tem sua própria geração, guardada no banco.
+    """
+
+    nome = "sqlite"
+    SQLITE_SEGMENT = "tabelas.sqlite"
+
+    def __init__(self):
+        self._lock = threading.Lock()  # nunca mantido enquanto se espera a TRAVA
+        self._conexao = None
+        self._geracao_segmento = None
+        self._geracoes = {}
+
+    @staticmethod
+    def _tabela_sql(model):
+        return os.path.splitext(MODEL_FILE_MAP[model])[0]
+
+    @staticmethod
+    def _colunas(model):
+        return [f.name for f in fields(model)]
+
+    def _criar_esquema(self, con):
+        con.execute("CREATE TABLE IF NOT EXISTS _geracoes (tabela TEXT PRIMARY KEY, geracao INTEGER NOT NULL)")
+        for model in MODEL_FILE_MAP:
+            tabela = self._tabela_sql(model)
+            colunas = ", ".join(f'"{c}" TEXT NOT NULL DEFAULT \'\'' for c in self._colunas(model))
+            con.execute(f'CREATE TABLE IF NOT EXISTS "{tabela}" ({colunas})')
+            for c in self._colunas(model):
+                if c.startswith("id_"):
+                    con.execute(f'CREATE INDEX IF NOT EXISTS "ix_{tabela}_{c}" ON "{tabela}" ("{c}")')
+        # a época distingue bancos recriados (migração), para gerações antigas nunca coincidirem
+        con.execute("INSERT OR IGNORE INTO _geracoes VALUES ('_epoca', ?)", (int.from_bytes(os.urandom(6), "big"),))
+
+    def _atualizar(self):
+        """Garante o banco da geração atual do segmento em memória (decifrado fora do _lock)."""
+        geracao = table_generation(self.SQLITE_SEGMENT)
+        with self._lock:
+            if self._conexao is not None and geracao == self._geracao_segmento:
+                return
+        geracao, conteudo = read_table_versioned(self.SQLITE_SEGMENT)
+        con = sqlite3.connect(":memory:", check_same_thread=False)
+        if conteudo:
+            con.deserialize(conteudo)
+        self._criar_esquema(con)
+        geracoes = dict(con.execute("SELECT tabela, geracao FROM _geracoes"))
+        with self._lock:
+            self._conexao, self._geracao_segmento, self._geracoes = con, geracao, geracoes
+
+    def _geracao_tabela(self, model):
+        return (self._geracoes["_epoca"], self._geracoes.get(self._tabela_sql(model), 0))
+
+    def geracao(self, model):
+        self._atualizar()
+        with self._lock:
+            return self._geracao_tabela(model)
+
+    def carregar(self, model):
+        self._atualizar()
+        colunas = self._colunas(model)
+        lista = ", ".join(f'"{c}"' for c in colunas)
+        with self._lock:
+            cursor = self._conexao.execute(f'SELECT {lista} FROM "{self._tabela_sql(model)}" ORDER BY rowid')
+            return self._geracao_tabela(model), [dict(zip(colunas, linha)) for linha in cursor]
+
+    def _aplicar(self, con, model, antes, depois):
+        tabela, colunas = self._tabela_sql(model), self._colunas(model)
+        lista = ", ".join(f'"{c}"' for c in colunas)
+        marcas = ", ".join("?" for _ in colunas)
+        linha = lambda d: tuple("" if d.get(c) is None else str(d.get(c)) for c in colunas)
+        if antes is None:
+            con.execute(f'DELETE FROM "{tabela}"')
+            con.executemany(f'INSERT INTO "{tabela}" ({lista}) VALUES ({marcas})', map(linha, depois))
+            return
+        # diferença como multiconjunto: só as linhas que mudaram chegam ao banco
+        saldo = Counter(map(linha, depois))
+        saldo.subtract(map(linha, antes))
+        pk = colunas.index(MODEL_ID_KEY[model])
+        saiu, entrou = defaultdict(list), defaultdict(list)
+        for valores, n in saldo.items():
+            for _ in range(abs(n)):
+                (entrou if n > 0 else saiu)[valores[pk]].append(valores)
+        onde = " AND ".join(f'"{c}" = ?' for c in colunas)
+        uma = f'rowid = (SELECT rowid FROM "{tabela}" WHERE {onde} LIMIT 1)'
+        atribuicoes = ", ".join(f'"{c}" = ?' for c in colunas)
+        for chave in set(saiu) | set(entrou):
+            velhas, novas = saiu.get(chave, []), entrou.get(chave, [])
+            for velha, nova in zip(velhas, novas):  # mesma chave: atualiza no lugar, mantendo a ordem
+                con.execute(f'UPDATE "{tabela}" SET {atribuicoes} WHERE {uma}', nova + velha)
+            for velha in velhas[len(novas):]:
+                con.execute(f'DELETE FROM "{tabela}" WHERE {uma}', velha)
+            for nova in novas[len(velhas):]:
+                con.execute(f'INSERT INTO "{tabela}" ({lista}) VALUES ({marcas})', nova)
+
+    def gravar(self, alteracoes: dict):
+        with TRAVA.escrita():
+            self._atualizar()
+            with self._lock:
+                con = self._conexao
+                try:
+                    inicio = con.total_changes
+                    with con:
+                        for model, (antes, depois) in alteracoes.items():
+                            mudancas = con.total_changes
+                            self._aplicar(con, model, antes, depois)
+                            if con.total_changes != mudancas:  # tabela sem linhas alteradas mantém a geração
+                                con.execute("INSERT INTO _geracoes VALUES (?, 1) ON CONFLICT(tabela) "
+                                            "DO UPDATE SET geracao = geracao + 1", (self._tabela_sql(model),))
+                    if con.total_changes == inicio:
+                        return  # nada mudou: o banco não é serializado nem cifrado de novo
+                    write_table(self.SQLITE_SEGMENT, con.serialize())
+                except BaseException:
+                    self._conexao = None  # memória pode ter divergido do disco: relê na próxima vez
+                    raise
+                self._geracoes = dict(con.execute("SELECT tabela, geracao FROM _geracoes"))
+                self._geracao_segmento = table_generation(self.SQLITE_SEGMENT)
+
+
+class MotorMemoria:
+    """
+    Tudo em memória do processo, sem disco, chave ou criptografia: para testes,
+    benchmarks e carga. As tabelas começam vazias ou com `tabelas`
+    ({model: linhas como dicts ou registros}) e somem quando o processo termina.
+    """
+
+    nome = "memoria"
+    persistente = False
+
+    def __init__(self, tabelas: dict = None):
+        self._epoca = int.from_bytes(os.urandom(6), "big")
+        self._tabelas = {m: ((self._epoca, 0), []) for m in MODEL_FILE_MAP}
+        self._segmentos = {}
+        self._log = {}  # período -> registros
+        for m, linhas in (tabelas or {}).items():
+            linhas = [l if isinstance(l, dict) else asdict(l) for l in linhas]
+            self._tabelas[m] = ((self._epoca, 1), _normalizar_linhas(m, linhas))
+
+    def geracao(self, model):
+        return self._tabelas[model][0]
+
+    def carregar(self, model):
+        geracao, linhas = self._tabelas[model]
+        return geracao, list(linhas)  # as linhas nunca são alteradas no lugar; só a lista é copiada
+
+    def gravar(self, alteracoes: dict):
+        with TRAVA.escrita():
+            for model, (_, depois) in alteracoes.items():
+                (epoca, n), _ = self._tabelas[model]
+                self._tabelas[model] = ((epoca, n + 1), list(depois))
+
+    def ler_segmento(self, nome):
+        return self._segmentos.get(nome, b"")
+
+    def gravar_segmento(self, nome, conteudo: bytes):
+        self._segmentos[nome] = conteudo
+
+    def anexar_log(self, registros):
+        with TRAVA.escrita():
+            for periodo, registro in registros:
+                self._log.setdefault(periodo, []).append(registro)
+
+    def periodos_log(self):
+        return sorted(self._log)
+
+    def tamanho_log(self, periodo):
+        return len(self._log.get(periodo, ()))
+
+    def ler_log(self, periodo, desde=0):
+        with TRAVA.leitura():
+            return enumerate(self._log.get(periodo, [])[desde:], start=desde + 1)
+
+
+MOTORES = {MotorCSV.nome: MotorCSV, MotorSQLite.nome: MotorSQLite, MotorMemoria.nome: MotorMemoria}
+_motor = None
+# já na importação, e não só no primeiro motor(): muita coisa pega a TRAVA antes
+# de resolver o motor, e com o motor em memória ela não deve criar data/.lock
+TRAVA.entre_processos = MOTORES.get(os.environ.get("KITS_MOTOR"), MotorCSV).persistente
+
+
+def motor():
+    """Motor em uso: KITS_MOTOR (csv|sqlite|memoria), csv por padrão."""
+    if _motor is None:
+        usar_motor(os.environ.get("KITS_MOTOR", MotorCSV.nome))
+    return _motor
+
+
+def _validar_motor(nome: str):
+    if nome not in MOTORES:
+        raise ValueError(f"Motor de armazenamento desconhecido: {nome} (use {', '.join(MOTORES)})")
+
+
+def _instalar_motor(novo):
+    global _motor
+    _motor = novo
+    TRAVA.entre_processos = novo.persistente  # em memória não há o que disputar com outros processos
+    invalidar_cache()
+    return novo
+
+
+def usar_motor(nome: str, **opcoes):
+    """Troca o motor do processo; `opcoes` vão para o construtor (ex.: tabelas= no motor em memória)."""
+    _validar_motor(nome)
+    return _instalar_motor(MOTORES[nome](**opcoes))
+
+
+def migrar_motor(origem: str, destino: str) -> dict:
+    """Copia todas as tabelas de um motor para outro; devolve {arquivo: linhas copiadas}."""
+    for nome in (origem, destino):
+        _validar_motor(nome)
+    if origem == destino:
+        raise ValueError("Origem e destino são o mesmo motor")
+    de, para = MOTORES[origem](), MOTORES[destino]()
+    with TRAVA.escrita():
+        tabelas = {m: de.carregar(m)[1] for m in MODEL_FILE_MAP}
+        para.gravar({m: (None, _normalizar_linhas(m, linhas)) for m, linhas in tabelas.items()})
+    _instalar_motor(para)  # a própria instância: o motor em memória não sobrevive a uma nova
+    return {MODEL_FILE_MAP[m]: len(linhas) for m, linhas in tabelas.items()}
+
+
+# ---------------- CACHE ---------------- #
+
+# Tabelas já decifradas ficam em memória enquanto o segmento cifrado não mudar.
+_cache_lock = threading.RLock()
+_cache_tabelas = {}
+
+
+def _parse_csv(conteudo: bytes):
+    return list(csv.DictReader(io.StringIO(conteudo.decode("utf-8-sig"), newline="")))
+
+
+def _serializar_csv(model, data) -> bytes:
+    buf = io.StringIO(newline="")
+    writer = csv.DictWriter(buf, fieldnames=[f.name for f in fields(model)])
+    writer.writeheader()
+    writer.writerows(data)
+    return buf.getvalue().encode("utf-8-sig")
+
+
+def _normalizar_linhas(model, data):
+    """Reproduz em memória o que o DictWriter grava e o DictReader devolve."""
+    nomes = [f.name for f in fields(model)]
+    return [{n: "" if d.get(n) is None else str(d.get(n)) for n in nomes} for d in data]
+
+
+def _normalizar_valores(model, dados: dict):
+    nomes = {f.name for f in fields(model)}
+    return {k: "" if v is None else str(v) for k, v in dados.items() if k in nomes}
+
+
+def _tabela_versionada(model):
+    """
+    (geração, tabela) do cache, relida do motor se a tabela mudou. A leitura
+    acontece fora do _cache_lock, que nunca é mantido enquanto se espera a
+    trava do armazenamento (ordem: TRAVA -> _cache_lock).
+    """
+    geracao = motor().geracao(model)
+    with _cache_lock:
+        em_cache = _cache_tabelas.get(model)
+        if em_cache is not None and em_cache[0] == geracao:
+            metrics.contar("cache_total", tabela=MODEL_FILE_MAP[model], resultado="acerto")
+            return em_cache
+    metrics.contar("cache_total", tabela=MODEL_FILE_MAP[model], resultado="falha")
+    with metrics.cronometro("armazenamento_segundos", operacao="carregar"):
+        geracao, linhas = motor().carregar(model)
+    metrics.contar("linhas_lidas_total", len(linhas), tabela=MODEL_FILE_MAP[model])
+    em_cache = (geracao, _Tabela(linhas))
+    with _cache_lock:
+        atual = _cache_tabelas.get(model)
+        if atual is not None and atual[0] == geracao:
+            return atual  # outro thread carregou a mesma geração antes
+        _cache_tabelas[model] = em_cache
+    return em_cache
+
+
+def _tabela(model):
+    return _tabela_versionada(model)[1]
+
+
+def invalidar_cache():
+    global _auditoria
+    with _cache_lock:
+        _cache_tabelas.clear()
+    with _auditoria_lock:
+        _auditoria = {}
+
+
+def _gravar_tabelas(tabelas: dict, snapshots: dict = None):
+    """Grava {model: linhas} pelo motor; `snapshots` ({model: linhas lidas}) permite gravar só a diferença."""
+    snapshots = snapshots or {}
+    novas = {m: _normalizar_linhas(m, d) for m, d in tabelas.items()}
+    with TRAVA.escrita():
+        with metrics.cronometro("armazenamento_segundos", operacao="gravar"):
+            motor().gravar({m: (snapshots.get(m), linhas) for m, linhas in novas.items()})
+        for m, linhas in novas.items():
+            metrics.contar("linhas_gravadas_total", len(linhas), tabela=MODEL_FILE_MAP[m])
+        novas = {m: (motor().geracao(m), _Tabela(linhas)) for m, linhas in novas.items()}
+        with _cache_lock:
+            _cache_tabelas.update(novas)
+
+
+# ---------------- TRANSAÇÕES ---------------- #
+
+_contexto = threading.local()
+
+
+class ConflitoTransacao(ValueError):
+    """Outra operação gravou, depois da leitura, uma tabela que a transação alterou."""
+
+
+class _Transacao:
+    """
+    Tabelas vistas pela transação; nada vai para o disco antes do commit.
+    Leituras usam a tabela do cache como snapshot (fixado na primeira leitura);
+    a cópia só é feita na primeira escrita da tabela.
+    """
+
+    def __init__(self):
+        self.tabelas = {}
+        self.geracoes = {}
+        self.snapshots = {}
+        self.proprias = set()
+        self.alteradas = []
+        self.logs = []
+        self.abortada = False
+
+    def ler(self, model):
+        if model not in self.tabelas:
+            self.geracoes[model], self.tabelas[model] = _tabela_versionada(model)
+            self.snapshots[model] = self.tabelas[model]
+        return self.tabelas[model]
+
+    def escrever(self, model):
+        if model not in self.proprias:
+            self.tabelas[model] = self.ler(model).copia()
+            self.proprias.add(model)
+        return self.tabelas[model]
+
+    def gravar(self, model, data):
+        self.tabelas[model] = _Tabela(_normalizar_linhas(model, data))
+        self.proprias.add(model)
+        self.marcar(model)
+
+    def marcar(self, model):
+        if model not in self.alteradas:
+            self.alteradas.append(model)
+
+    def commit(self):
+        """
+        Validação otimista: sob a trava de escrita, cada tabela alterada a partir de
+        um snapshot precisa estar na mesma geração lida; senão outra transação
+        (thread ou processo) gravou antes e esta é recusada, sem gravar nada.
+        Tabelas escritas que terminaram iguais ao snapshot não vão para o motor.
+        """
+        sujas = [m for m in self.alteradas if m not in self.snapshots or list(self.tabelas[m]) != list(self.snapshots[m])]
+        if not sujas and not self.logs:
+            return  # só leitura: nem pega a trava de escrita
+        with TRAVA.escrita():
+            for m in sujas:
+                if m in self.geracoes and motor().geracao(m) != self.geracoes[m]:
+                    metrics.contar("conflitos_total", tabela=MODEL_FILE_MAP[m])
+                    raise ConflitoTransacao(f"Conflito: {MODEL_FILE_MAP[m]} foi alterada por outra operação; tente novamente")
+            if sujas:
+                _gravar_tabelas({m: list(self.tabelas[m]) for m in sujas},
+                                {m: list(self.snapshots[m]) for m in sujas if m in self.snapshots})
+            motor().anexar_log(self.logs)
+
+
+def _transacao_atual():
+    return getattr(_contexto, "transacao", None)
+
+
+def abrir_transacao():
+    """Abre a transação do thread atual sem bloco `with` (ex.: uma por requisição web)."""
+    if _transacao_atual() is not None:
+        raise ValueError("Já existe uma transação aberta neste thread")
+    _contexto.transacao = _Transacao()
+    return _contexto.transacao
+
+
+def fechar_transacao(gravar=True):
+    """Encerra a transação do thread (se houver): grava, a menos que `gravar` seja False ou ela tenha sido abortada."""
+    tx = _transacao_atual()
+    _contexto.transacao = None
+    if tx is not None and gravar and not tx.abortada:
+        tx.commit()
+
+
+@contextmanager
+def transaction():
+    """
+    Agrupa leituras e gravações em uma unidade de trabalho: as tabelas são
+    decifradas uma vez, alteradas em memória e gravadas juntas ao final.
+    Se ocorrer exceção, nada é gravado. Chamadas aninhadas participam da
+    transação externa; uma exceção dentro delas aborta a externa inteira,
+    mesmo que seja tratada por quem chamou. Uma transação avulsa roda inteira
+    sob a trava de escrita: escritores são serializados (entre threads e
+    processos) e o commit nunca encontra conflito.
+    """
+    atual = _transacao_atual()
+    if atual is not None:
+        try:
+            yield atual
+        except BaseException:
+            atual.abortada = True
+            raise
+        return
+    with TRAVA.escrita():
+        tx = abrir_transacao()
+        try:
+            yield tx
+        except BaseException:
+            fechar_transacao(gravar=False)
+            raise
+        fechar_transacao()
+
+
 # ---------------- AUXILIARES ---------------- #
 
+def _tabela_atual(model):
+    tx = _transacao_atual()
+    return tx.ler(model) if tx is not None else _tabela(model)
+
+
+@metrics.medir("armazenamento_segundos", operacao="read_csv")
 def read_csv(model):
-    restore_data()
-    file = os.path.join(DATA_DIR, MODEL_FILE_MAP[model])
-    rows = []
-    if os.path.exists(file):
-        with open(file, "r", encoding="utf-8-sig", newline="") as f:
-            rows = list(csv.DictReader(f))
-    backup_data()
-    return rows
+    return [dict(row) for row in _tabela_atual(model)]
 
 
+@metrics.medir("armazenamento_segundos", operacao="write_csv")
 def write_csv(model, data):
-    restore_data()
-    file = os.path.join(DATA_DIR, MODEL_FILE_MAP[model])
-    with open(file, "w", encoding="utf-8-sig", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=[f.name for f in fields(model)])
-        writer.writeheader()
-        writer.writerows(data)
-    backup_data()
+    tx = _transacao_atual()
+    if tx is not None:
+        tx.gravar(model, data)
+    else:
+        _gravar_tabelas({model: data})
 
 
 def dicts_to_objects(data: List[dict], modelo: Type):
-    allowed = {f.name for f in fields(modelo)}
-    objs = []
-    for d in data:
-        payload = {k: (v if v != "" else None) for k, v in d.items() if k in allowed}
-        objs.append(modelo(**payload))
-    return objs
+    return rows_to_records(modelo, data)
 
 
 def objects_to_dicts(objs: List):
-    dicts = []
-    for o in objs:
-        d = asdict(o)
-        if "qntd" in d and d["qntd"] is not None:
-            d["qntd"] = str(d["qntd"])
-        dicts.append(d)
-    return dicts
+    return [record_to_row(o) for o in objs]
 
 
 def get_file_for_model(modelo: Type) -> str:
     return MODEL_FILE_MAP[modelo]
 
 
-def gerar_id(modelo: Type) -> str:
-    dados = read_csv(modelo)
-    chave_id = [f.name for f in fields(modelo) if f.name.startswith("id_")][0]
+def _buscar(modelo: Type, chave: str, valor):
+    """Primeira linha com chave == valor, via índice (sem copiar)."""
+    tabela = _tabela_atual(modelo)
+    posicoes = tabela.indice(chave).get(valor)
+    return tabela.linhas[posicoes[0]] if posicoes else None
+
+
+def obter_registro(modelo: Type, id_registro: str):
+    """Busca pontual pela chave primária do modelo (ver MODEL_ID_KEY)."""
+    linha = _buscar(modelo, MODEL_ID_KEY[modelo], id_registro)
+    return row_to_record(modelo, linha) if linha is not None else None
+
+
+def _montar_logins(usuarios):
+    """login (sem espaços nem caixa) -> linha do usuário; vale o primeiro cadastrado."""
+    logins = {}
+    for linha in usuarios:
+        logins.setdefault((linha.get("usuario") or "").strip().lower(), linha)
+    logins.pop("", None)
+    return logins
+
+
+def buscar_usuario_por_login(login: str):
+    """Usuário pelo login, sem diferenciar maiúsculas; índice refeito só quando a tabela muda."""
+    linha = _tabela_atual(Usuario).derivado(_montar_logins).get((login or "").strip().lower())
+    return row_to_record(Usuario, linha) if linha is not None else None
+
+
+def validar_relacionamentos(novo_registro, modelo):
+    if modelo.__name__ == "Colaborador":
+        if _buscar(Usuario, "id_usuario", novo_registro.id_gestor) is None:
+            raise ValueError(f"Gestor {novo_registro.id_gestor} não existe em usuários")
+        if _buscar(Kit, "id_kit", novo_registro.id_kit) is None:
+            raise ValueError(f"Kit {novo_registro.id_kit} não existe em kits")
+        if _buscar(Agencia, "id_agencia", novo_registro.id_agencia) is None:
+            raise ValueError(f"Agência {novo_registro.id_agencia} não existe em agencias")
+    elif modelo.__name__ == "EstoqueItem":
+        if _buscar(Kit, "id_kit", novo_registro.id_kit) is None:
+            raise ValueError(f"Kit {novo_registro.id_kit} não existe em kits")
+
+
+# ---------------- SEQUÊNCIAS DE ID ---------------- #
+
+# Último número entregue por modelo; nunca volta atrás, mesmo após remoções.
+SEQUENCE_FILE = "sequencias.json"
+
+
+def _ler_sequencias() -> dict:
+    conteudo = motor().ler_segmento(SEQUENCE_FILE)
+    return json.loads(conteudo) if conteudo else {}
+
+
+def _maior_id(modelo: Type) -> int:
+    """Semente da sequência: maior número já usado na tabela (lido uma única vez)."""
+    chave_id = MODEL_ID_KEY[modelo]
     prefixo = MODEL_ID_PREFIX[modelo]
     existentes = []
-    for d in dados:
+    for d in _tabela_atual(modelo):
         valor = d.get(chave_id, "")
         if valor.startswith(prefixo):
             try:
                 existentes.append(int(valor[len(prefixo):]))
             except ValueError:
                 continue
+    return max(existentes, default=0)
 
-    proximo = max(existentes, default=0) + 1
-    return f"{prefixo}{proximo:03d}"
 
+def _formatar_id(modelo: Type, numero: int) -> str:
+    return f"{MODEL_ID_PREFIX[modelo]}{numero:03d}"
 
-def validar_relacionamentos(novo_registro, modelo):
-    if modelo.__name__ == "Colaborador":
-        usuarios = read_csv(Usuario)
-        if not any(u["id_usuario"] == novo_registro.id_gestor for u in usuarios):
-            raise ValueError(f"Gestor {novo_registro.id_gestor} não existe em usuários")
-        kits = read_csv(Kit)
-        if not any(k["id_kit"] == novo_registro.id_kit for k in kits):
-            raise ValueError(f"Kit {novo_registro.id_kit} não existe em kits")
-        agencias = read_csv(Agencia)
-        if not any(a["id_agencia"] == novo_registro.id_agencia for a in agencias):
-            raise ValueError(f"Agência {novo_registro.id_agencia} não existe em agencias")
-    elif modelo.__name__ == "EstoqueItem":
-        kits = read_csv(Kit)
-        if not any(k["id_kit"] == novo_registro.id_kit for k in kits):
-            raise ValueError(f"Kit {novo_registro.id_kit} não existe em kits")
+
+def reservar_ids(modelo: Type, quantidade: int = 1) -> List[str]:
+    """Reserva um bloco de ids consecutivos; a reserva é gravada na hora, fora de transações."""
+    with TRAVA.escrita():  # ler-incrementar-gravar serializado entre threads e processos
+        sequencias = _ler_sequencias()
+        ultimo = sequencias.get(modelo.__name__)
+        if ultimo is None:
+            ultimo = _maior_id(modelo)
+        sequencias[modelo.__name__] = ultimo + quantidade
+        motor().gravar_segmento(SEQUENCE_FILE, json.dumps(sequencias, sort_keys=True).encode("utf-8"))
+    return [_formatar_id(modelo, n) for n in range(ultimo + 1, ultimo + quantidade + 1)]
+
+
+def proximo_id(modelo: Type) -> str:
+    """Id que o próximo gerar_id entregará, sem reservá-lo."""
+    ultimo = _ler_sequencias().get(modelo.__name__)
+    return _formatar_id(modelo, (_maior_id(modelo) if ultimo is None else ultimo) + 1)
+
+
+def gerar_id(modelo: Type) -> str:
+    return reservar_ids(modelo, 1)[0]
 
 
 # ---------------- DEBUG ---------------- #
 
 def debug_dados(mostrar_tudo: bool = False, limite: int = 5):
-    restore_data()
-    print("\n=== DEBUG: Conteúdo dos arquivos CSV ===\n")
+    """Mostra o conteúdo das tabelas lido pelo motor, sem gravar nada (nem CSVs em claro) em disco."""
+    print("\n=== DEBUG: Conteúdo das tabelas ===\n")
     for modelo, nome_arquivo in MODEL_FILE_MAP.items():
-        caminho = os.path.join(DATA_DIR, nome_arquivo)
-        if not os.path.exists(caminho):
+        if motor().geracao(modelo) is None:
             print(f"[AVISO] {nome_arquivo} não encontrado.")
             continue
         print(f"\n--- {nome_arquivo} ({modelo.__name__}) ---")
-        with open(caminho, "r", encoding="utf-8-sig") as f:
-            reader = list(csv.DictReader(f))
-            if not reader:
-                print("(vazio)")
-            else:
-                registros = reader if mostrar_tudo else reader[:limite]
-                for i, row in enumerate(registros, start=1):
-                    print(f"{i}: {row}")
-                if not mostrar_tudo and len(reader) > limite:
-                    print(f"... ({len(reader)-limite} registros ocultos)")
+        linhas = read_csv(modelo)
+        if not linhas:
+            print("(vazio)")
+        else:
+            registros = linhas if mostrar_tudo else linhas[:limite]
+            for i, row in enumerate(registros, start=1):
+                print(f"{i}: {row}")
+            if not mostrar_tudo and len(linhas) > limite:
+                print(f"... ({len(linhas)-limite} registros ocultos)")
     print("\n=== FIM DEBUG ===\n")
 
 
 # ---------------- LOG ---------------- #
 
-def log_action(usuario: str, resultado: dict):
-    restore_data()
-    log_file = os.path.join(DATA_DIR, "logs.csv")
-    file_exists = os.path.exists(log_file)
-    fieldnames = [
-        "usuario",
-        "data",
-        "hora",
-        "acao",
-        "linha_antes",
-        "linha_depois",
-    ]
-    now = datetime.now()
-    row = {
+LOG_FILE = "logs.csv"  # formato legado, migrado para o log cifrado por registro
+LOG_FIELDS = ["usuario", "data", "hora", "acao", "linha_antes", "linha_depois"]  # registros da versão 1
+
+# Registro de auditoria: um objeto JSON por linha, versão LOG_VERSAO.
+#   v        versão do esquema
+#   ts       "AAAA-MM-DDTHH:MM:SS" (hora local); o mês (AAAA-MM) é o período do arquivo
+#   usuario  quem executou
+#   acao     REGISTRAR, ATUALIZAR, REMOVER, IMPORTAR_COLABORADOR, REGISTRAR_KIT_AUTO...
+#   id       chave primária da linha afetada ("" se não houver)
+#   diff     {campo: [antes, depois]} só dos campos alterados, quando há as duas linhas
+#   depois   linha completa, só quando não há "antes" (inclusão)
+#   antes    linha completa, só quando não há "depois" (remoção)
+# Registros da versão 1 (LOG_FIELDS, com as linhas como str(dict)) continuam legíveis.
+LOG_VERSAO = 2
+
+
+def _valor_log(valor):
+    if valor is None: return ""
+    if isinstance(valor, (str, dict, list)): return valor
+    return valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+
+
+def _linha_log(linha):
+    """Linha do resultado de uma operação (ou str(dict) da versão 1) como dict de texto; None se vazia."""
+    if isinstance(linha, str) and linha.startswith("{"):
+        try:
+            linha = ast.literal_eval(linha)
+        except (ValueError, SyntaxError):
+            return None
+    if not isinstance(linha, dict) or not linha:
+        return None
+    return {k: _valor_log(v) for k, v in linha.items()}
+
+
+def _chave_primaria(linha) -> str:
+    chave = next((k for k in (linha or {}) if k.startswith("id_")), None)
+    return str(linha[chave] or "") if chave else ""
+
+
+def _diff_linhas(antes: dict, depois: dict) -> dict:
+    return {c: [antes.get(c, ""), depois.get(c, "")] for c in dict.fromkeys([*antes, *depois])
+            if antes.get(c, "") != depois.get(c, "")}
+
+
+def montar_registro_log(usuario: str, resultado: dict, momento: datetime = None) -> dict:
+    """Registro de auditoria (esquema LOG_VERSAO) do resultado de uma operação do manager."""
+    antes, depois = _linha_log(resultado.get("linha_antes")), _linha_log(resultado.get("linha_depois"))
+    registro = {
+        "v": LOG_VERSAO,
+        "ts": (momento or datetime.now()).strftime("%Y-%m-%dT%H:%M:%S"),
         "usuario": usuario or getpass.getuser(),
-        "data": now.strftime("%Y-%m-%d"),
-        "hora": now.strftime("%H:%M:%S"),
         "acao": resultado.get("acao", ""),
-        "linha_antes": str(resultado.get("linha_antes") or ""),
-        "linha_depois": str(resultado.get("linha_depois") or ""),
+        "id": _chave_primaria(antes or depois),
     }
-    with open(log_file, "a", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if not file_exists or os.stat(log_file).st_size == 0:
-            writer.writeheader()
-        writer.writerow(row)
-    backup_data()
+    if antes and depois:
+        registro["diff"] = _diff_linhas(antes, depois)
+    elif depois:
+        registro["depois"] = depois
+    elif antes:
+        registro["antes"] = antes
+    return registro
+
+
+def ler_registro_log(registro: dict) -> dict:
+    """Visão uniforme de um registro do log, de qualquer versão: data, hora, usuario, acao, id, diff, antes, depois."""
+    if registro.get("v", 1) >= 2:
+        data, _, hora = registro.get("ts", "").partition("T")
+        antes, depois, diff = registro.get("antes"), registro.get("depois"), registro.get("diff")
+        id_registro = registro.get("id", "")
+    else:
+        data, hora = registro.get("data", ""), registro.get("hora", "")
+        antes, depois = _linha_log(registro.get("linha_antes")), _linha_log(registro.get("linha_depois"))
+        id_registro = _chave_primaria(antes or depois)
+        diff = None
+        if antes and depois:
+            diff, antes, depois = _diff_linhas(antes, depois), None, None
+    return {"v": registro.get("v", 1), "data": data, "hora": hora, "usuario": registro.get("usuario", ""),
+            "acao": registro.get("acao", ""), "id": id_registro, "diff": diff, "antes": antes, "depois": depois}
+
+
+def _periodo_registro(registro: bytes) -> str:
+    """Período (AAAA-MM) de um registro cifrado do log, de qualquer versão."""
+    return (ler_registro_log(json.loads(registro))["data"][:7] or "0000-00")
+
+
+def _migrar_log_csv():
+    if table_generation(LOG_FILE) is None:
+        return
+    with TRAVA.escrita():
+        if table_generation(LOG_FILE) is None:
+            return  # já migrado por outro thread/processo
+        por_periodo = defaultdict(list)
+        for row in _parse_csv(read_table(LOG_FILE)):
+            por_periodo[row.get("data", "")[:7] or "0000-00"].append(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+        for periodo, lote in por_periodo.items():
+            append_log(lote, periodo)
+        delete_table(LOG_FILE)
+
+
+def _migrar_logs():
+    """Formatos anteriores do log (logs.csv e logs.enc único) para os arquivos por período."""
+    _migrar_log_csv()
+    split_log(_periodo_registro)
+
+
+@metrics.medir("armazenamento_segundos", operacao="log_action")
+def log_action(usuario: str, resultado: dict):
+    registro = montar_registro_log(usuario, resultado)
+    linha = (registro["ts"][:7], json.dumps(registro, ensure_ascii=False, default=str).encode("utf-8"))
+    tx = _transacao_atual()
+    if tx is not None:
+        tx.logs.append(linha)
+    else:
+        motor().anexar_log([linha])
+
+
+def _periodos_log(inicio=None, fim=None):
+    return [p for p in motor().periodos_log() if (not inicio or p >= inicio[:7]) and (not fim or p <= fim[:7])]
+
+
+def iter_log(inicio: str = None, fim: str = None):
+    """
+    Percorre o log em ordem, decifrando um registro por vez direto dos arquivos
+    mensais (sem índice nem lista em memória), só nos meses que cruzam [inicio, fim].
+    Cada item é ler_registro_log com "n" ("AAAA-MM/posição").
+    """
+    for periodo in _periodos_log(inicio, fim):
+        for i, (_, registro) in enumerate(motor().ler_log(periodo), start=1):
+            yield {"n": f"{periodo}/{i}", **ler_registro_log(json.loads(registro))}
+
+
+def _confere_log(row, usuario=None, acao=None, id_registro=None, inicio=None, fim=None) -> bool:
+    """Filtros de consultar_log aplicados a um registro de ler_registro_log."""
+    momento = f"{row['data']} {row['hora']}"
+    return ((not usuario or row["usuario"] == usuario)
+            and (not acao or row["acao"] == acao)
+            and (not id_registro or row["id"] == id_registro)
+            and (not inicio or momento[:len(inicio)] >= inicio)
+            and (not fim or momento[:len(fim)] <= fim))
+
+
+# ---------------- AUDITORIA ---------------- #
+
+class _IndiceAuditoria:
+    """
+    Registros de um período do log já decifrados, com índices usuário/ação/data/id
+    -> posições (crescentes). O log só cresce: cada atualização decifra apenas o
+    que foi anexado desde a anterior.
+    """
+
+    def __init__(self, periodo):
+        self.periodo = periodo
+        self.registros = []
+        self.posicao = 0
+        self.por_usuario = defaultdict(list)
+        self.por_acao = defaultdict(list)
+        self.por_data = defaultdict(list)
+        self.por_id = defaultdict(list)
+        self.datas = []  # datas distintas, em ordem, para consultas por intervalo
+
+    def anexar(self, row: dict):
+        n = len(self.registros)
+        self.registros.append(row)
+        self.por_usuario[row["usuario"]].append(n)
+        self.por_acao[row["acao"]].append(n)
+        if row["data"] not in self.por_data:
+            insort(self.datas, row["data"])
+        self.por_data[row["data"]].append(n)
+        if row["id"]:
+            self.por_id[row["id"]].append(n)
+
+    def atualizar(self):
+        if motor().tamanho_log(self.periodo) == self.posicao:
+            return
+        for posicao, registro in motor().ler_log(self.periodo, self.posicao):
+            self.anexar(ler_registro_log(json.loads(registro)))
+            self.posicao = posicao
+
+    def faixa(self, inicio, fim):
+        de = bisect_left(self.datas, inicio[:10]) if inicio else 0
+        ate = bisect_right(self.datas, fim[:10]) if fim else len(self.datas)
+        return list(heapq.merge(*(self.por_data[d] for d in self.datas[de:ate])))
+
+    def selecionar(self, usuario=None, acao=None, id_registro=None, inicio=None, fim=None):
+        candidatas = []
+        if usuario: candidatas.append(self.por_usuario.get(usuario, []))
+        if acao: candidatas.append(self.por_acao.get(acao, []))
+        if id_registro: candidatas.append(self.por_id.get(id_registro, []))
+        if inicio or fim: candidatas.append(self.faixa(inicio, fim))
+        if not candidatas:
+            return list(range(len(self.registros)))
+        # percorre só a menor lista de posições; as demais condições são testadas no registro
+        posicoes = min(candidatas, key=len)
+        if len(candidatas) == 1 and not (inicio or fim):
+            return list(posicoes)
+
+        return [n for n in posicoes if _confere_log(self.registros[n], usuario, acao, id_registro, inicio, fim)]
+
+
+_auditoria_lock = threading.RLock()  # reentrante: o primeiro motor() chama invalidar_cache
+_auditoria = {}  # período -> _IndiceAuditoria
+
+
+def _indices_auditoria(inicio=None, fim=None):
+    """Índices dos períodos que cruzam [inicio, fim], postos em dia (chamar com _auditoria_lock)."""
+    indices = []
+    for periodo in _periodos_log(inicio, fim):
+        idx = _auditoria.get(periodo)
+        if idx is None or motor().tamanho_log(periodo) < idx.posicao:
+            idx = _auditoria[periodo] = _IndiceAuditoria(periodo)  # arquivo novo ou trocado: reconstrói
+        idx.atualizar()
+        indices.append(idx)
+    return indices
+
+
+def consultar_log(usuario=None, acao=None, id_registro=None, inicio=None, fim=None,
+                  pagina=1, por_pagina=50, desc=True) -> dict:
+    """
+    Página do log de ações pelos índices, sem percorrer o log inteiro; com `inicio`
+    ou `fim`, os meses de fora nem são abertos. `inicio` e `fim` são "AAAA-MM-DD"
+    ou "AAAA-MM-DD HH:MM[:SS]", inclusivos; `id_registro` é a chave primária da
+    linha afetada. `por_pagina=None` devolve tudo de uma vez. Mesmo formato de
+    paginar_registros; cada registro (ler_registro_log) leva também "n", sua
+    posição no log ("AAAA-MM/posição").
+    """
+    with _auditoria_lock:
+        selecionadas = [(idx, n) for idx in _indices_auditoria(inicio, fim)
+                        for n in idx.selecionar(usuario, acao, id_registro, inicio, fim)]
+        total = len(selecionadas)
+        por_pagina = max(1, int(por_pagina)) if por_pagina else max(1, total)
+        paginas = max(1, -(-total // por_pagina))
+        pagina = min(max(1, int(pagina)), paginas)
+        if desc:
+            selecionadas.reverse()
+        janela = selecionadas[(pagina - 1) * por_pagina: pagina * por_pagina]
+        registros = [{"n": f"{idx.periodo}/{n + 1}", **idx.registros[n]} for idx, n in janela]
+    return {"registros": registros, "total": total, "pagina": pagina, "paginas": paginas, "por_pagina": por_pagina}
+
+
+def historico_registro(id_registro: str) -> List[dict]:
+    """Todas as ações sobre um registro (pela chave primária), da mais antiga à mais recente."""
+    return consultar_log(id_registro=id_registro, por_pagina=None, desc=False)["registros"]
+
+
+def opcoes_log() -> dict:
+    """Usuários e ações presentes no log, para filtros."""
+    with _auditoria_lock:
+        indices = _indices_auditoria()
+        return {"usuarios": sorted({u for idx in indices for u in idx.por_usuario}),
+                "acoes": sorted({a for idx in indices for a in idx.por_acao})}
+
+
+def descrever_registro_log(row: dict) -> List[str]:
+    """Linhas legíveis do que mudou em um registro de ler_registro_log."""
+    if row["diff"] is not None:
+        return [f"{campo}: {antes!r} -> {depois!r}" for campo, (antes, depois) in row["diff"].items()] or ["(sem alterações)"]
+    if row["depois"] is not None:
+        return ["incluído: " + ", ".join(f"{c}={v!r}" for c, v in row["depois"].items())]
+    if row["antes"] is not None:
+        return ["removido: " + ", ".join(f"{c}={v!r}" for c, v in row["antes"].items())]
+    return []
+
+
+def imprimir_log_formatado(usuario=None, acao=None, id_registro=None, inicio=None, fim=None):
+    """Imprime o log de ações (ou só o que casar com os filtros de consultar_log), em ordem, lendo-o aos poucos (iter_log)."""
+    encontrados = 0
+    for row in iter_log(inicio, fim):
+        if not _confere_log(row, usuario, acao, id_registro, inicio, fim):
+            continue
+        if not encontrados:
+            print("\n===== LOG DE AÇÕES =====")
+        encontrados += 1
+        print(f"\n#{row['n']} [{row['data']} {row['hora']}] usuário={row['usuario']} ação={row['acao']} registro={row['id']}")
+        for linha in descrever_registro_log(row):
+            print("  -", linha)
+    if not encontrados:
+        print("\n[LOG] Nenhum log encontrado.")
+        return
+    print("========================\n")
+
+
+# ---------------- KITS ---------------- #
+
+ORDEM_TAMANHOS = ["PP", "P", "M", "G", "GG", "XG", "XXG", "XXL"]
+
+
+def _montar_bom(kits) -> dict:
+    bom = {}
+    for k in kits:
+        kit = bom.setdefault(k["id_kit"], {"nome_kit": "", "itens": {}})
+        kit["nome_kit"] = kit["nome_kit"] or (k.get("nome_kit") or "").strip()
+        tamanhos = kit["itens"].setdefault((k.get("item") or "").strip(), {})
+        tamanho = (k.get("tamanho_camisa") or "").strip()
+        tamanhos[tamanho] = tamanhos.get(tamanho, 0) + int(k.get("qntd") or 0)
+    return bom
+
+
+def _montar_catalogo(kits):
+    ordem = {t: i for i, t in enumerate(ORDEM_TAMANHOS)}
+    kit_catalog = {}
+    for id_kit, kit in kits.derivado(_montar_bom).items():
+        nome = kit["nome_kit"]
+        if not nome:
+            continue
+        entrada = kit_catalog.setdefault(nome, {"id_kit": id_kit, "items": {}})
+        if not entrada["id_kit"] and id_kit:
+            entrada["id_kit"] = id_kit
+        for item, tamanhos in kit["itens"].items():
+            if not item:
+                continue
+            sizes = set(entrada["items"].get(item, ())) | {t for t in tamanhos if t}
+            entrada["items"][item] = sorted(sizes, key=lambda t: (ordem.get(t, 999), t))
+    return kit_catalog, sorted(kit_catalog.keys(), key=lambda s: s.lower())
+
+
+def kit_bom(id_kit: str = None) -> dict:
+    """
+    Composição dos kits: id_kit -> {"nome_kit", "itens": {item: {tamanho: qntd}}}.
+    Calculada uma vez por versão da tabela de kits. Com id_kit, devolve só os itens daquele kit.
+    """
+    bom = _tabela_atual(Kit).derivado(_montar_bom)
+    if id_kit is None:
+        return bom
+    return bom.get(id_kit, {}).get("itens", {})
+
+
+def catalogo_kits():
+    """(catálogo por nome de kit com itens e tamanhos ordenados, nomes de kits ordenados)."""
+    return _tabela_atual(Kit).derivado(_montar_catalogo)
 
 
 # ---------------- ESTOQUE ---------------- #
 
+def _chave_item_estoque(id_kit: str, item: str, tamanho: str):
+    """(kit, item normalizado, tamanho normalizado); o tamanho só conta para camisas."""
+    item = (item or "").strip().lower()
+    tam = (tamanho or "").strip().upper() if "camisa" in item else None
+    return (id_kit or "", item, tam)
+
+
+def _chave_estoque(linha: dict):
+    return _chave_item_estoque(linha.get("id_kit"), linha.get("item"), linha.get("tamanho_camisa"))
+
+
+def _linhas_kit(id_kit: str, tamanho_camisa: str):
+    """Linhas do kit aplicáveis ao tamanho de camisa: [(item, tamanho, qntd)]."""
+    selecionadas = []
+    for nome_item, tamanhos in kit_bom(id_kit).items():
+        camisa = "camisa" in nome_item.lower()
+        for tam_kit, req in tamanhos.items():
+            tam_kit = tam_kit.upper()
+            if not camisa or (tamanho_camisa and tam_kit == tamanho_camisa.upper()):
+                selecionadas.append((nome_item, tam_kit, req))
+    return selecionadas
+
+
+@transaction()
 def alterar_estoque(id_kit: str, item_nome: str, tamanho: str, quantidade: int):
-    dados = read_csv(EstoqueItem)
-    for item in dados:
-        if (
-            item["id_kit"] == id_kit
-            and item["item"].lower() == item_nome.lower()
-            and (not "camisa" in item_nome.lower() or item["tamanho_camisa"].upper() == tamanho.upper())
-        ):
-            qntd = int(item["qntd"])
-            novo_qntd = qntd + quantidade
-            if novo_qntd < 0:
-                raise ValueError(f"Estoque insuficiente para {item_nome} ({tamanho})")
-            item["qntd"] = str(novo_qntd)
-            break
-    write_csv(EstoqueItem, dados)
+    estoque = _transacao_atual().escrever(EstoqueItem)
+    posicoes = estoque.indice(_chave_estoque).get(_chave_item_estoque(id_kit, item_nome, tamanho))
+    if posicoes:
+        pos = posicoes[0]
+        novo_qntd = int(estoque.linhas[pos]["qntd"] or 0) + quantidade
+        if novo_qntd < 0:
+            raise ValueError(f"Estoque insuficiente para {item_nome} ({tamanho})")
+        estoque.atualizar(pos, {"qntd": str(novo_qntd)})
+        _transacao_atual().marcar(EstoqueItem)
 
 
-def ajustar_estoque_para_kit(id_kit: str, tamanho_camisa: str, delta: int):
-    itens_kit = [row for row in read_csv(Kit) if row["id_kit"] == id_kit]
-    dados_estoque = read_csv(EstoqueItem)
-    selecionados = []
-    for k in itens_kit:
-        nome_item = (k.get("item") or "").lower()
-        tam_kit = (k.get("tamanho_camisa") or "").upper()
-        if "camisa" in nome_item:
-            if tamanho_camisa and tam_kit == (tamanho_camisa or "").upper():
-                selecionados.append(k)
-        else:
-            selecionados.append(k)
-    for k in selecionados:
-        nome_item = (k.get("item") or "")
-        tam_kit = (k.get("tamanho_camisa") or "").upper()
-        req = int(k.get("qntd") or 0)
-        alvo = None
-        for e in dados_estoque:
-            mesmo_kit = e.get("id_kit") == id_kit
-            mesmo_item = (e.get("item") or "").lower() == nome_item.lower()
-            if "camisa" in nome_item.lower():
-                mesmo_tam = (e.get("tamanho_camisa") or "").upper() == tam_kit
-            else:
-                mesmo_tam = True
-            if mesmo_kit and mesmo_item and mesmo_tam:
-                alvo = e
-                break
-        if not alvo:
+def _movimentos_kit(estoque, id_kit: str, tamanho_camisa: str, delta: int) -> dict:
+    """{posição no estoque: variação} de um kit; ValueError se faltar algum item."""
+    indice = estoque.indice(_chave_estoque)
+    movimentos = {}
+    for nome_item, tam_kit, req in _linhas_kit(id_kit, tamanho_camisa):
+        posicoes = indice.get(_chave_item_estoque(id_kit, nome_item, tam_kit))
+        if not posicoes:
             raise ValueError(f"Item '{nome_item}' (tam {tam_kit or 'NA'}) não encontrado no estoque para o kit {id_kit}")
-        atual = int(alvo.get("qntd") or 0)
-        novo = atual + delta * req
+        movimentos[posicoes[0]] = movimentos.get(posicoes[0], 0) + delta * req
+    return movimentos
+
+
+def _acumular_movimentos(estoque, saldo: dict, movimentos: dict):
+    """Soma os movimentos ao saldo por linha; se alguma ficar negativa, levanta ValueError sem tocar no saldo."""
+    novos = {}
+    for pos, mov in movimentos.items():
+        novo = saldo.get(pos, int(estoque.linhas[pos].get("qntd") or 0)) + mov
         if novo < 0:
-            raise ValueError(f"Estoque insuficiente para item '{nome_item}' (tam {tam_kit or 'NA'})")
-    for k in selecionados:
-        nome_item = (k.get("item") or "")
-        tam_kit = (k.get("tamanho_camisa") or "").upper()
-        req = int(k.get("qntd") or 0)
-        for e in dados_estoque:
-            mesmo_kit = e.get("id_kit") == id_kit
-            mesmo_item = (e.get("item") or "").lower() == nome_item.lower()
-            if "camisa" in nome_item.lower():
-                mesmo_tam = (e.get("tamanho_camisa") or "").upper() == tam_kit
-            else:
-                mesmo_tam = True
-            if mesmo_kit and mesmo_item and mesmo_tam:
-                atual = int(e.get("qntd") or 0)
-                e["qntd"] = str(atual + delta * req)
-                break
-    write_csv(EstoqueItem, dados_estoque)
+            linha = estoque.linhas[pos]
+            raise ValueError(f"Estoque insuficiente para item '{linha['item']}' (tam {linha['tamanho_camisa'] or 'NA'})")
+        novos[pos] = novo
+    saldo.update(novos)
+
+
+def _gravar_saldo(saldo: dict):
+    if not saldo:
+        return
+    estoque = _transacao_atual().escrever(EstoqueItem)  # mesmas posições do snapshot lido
+    for pos, qntd in saldo.items():
+        estoque.atualizar(pos, {"qntd": str(qntd)})
+    _transacao_atual().marcar(EstoqueItem)
+
+
+@transaction()
+def ajustar_estoque_para_kit(id_kit: str, tamanho_camisa: str, delta: int):
+    estoque = _transacao_atual().ler(EstoqueItem)
+    saldo = {}
+    _acumular_movimentos(estoque, saldo, _movimentos_kit(estoque, id_kit, tamanho_camisa, delta))
+    _gravar_saldo(saldo)
+
+
+@transaction()
+def reservar_kits(demandas: list, delta: int = -1) -> dict:
+    """
+    Reserva (delta=-1) ou devolve (delta=+1) kits para vários colaboradores de
+    uma vez. `demandas` é uma lista de (id_kit, tamanho_camisa). As quantidades
+    são somadas por linha de estoque, na ordem das demandas, e só são gravadas
+    se todas couberem; caso contrário nada muda e `falhas` diz quais não couberam.
+    """
+    estoque = _transacao_atual().ler(EstoqueItem)
+    saldo = {}
+    falhas = []
+    kits = _tabela_atual(Kit).indice("id_kit")
+    for i, (id_kit, tamanho_camisa) in enumerate(demandas):
+        try:
+            if id_kit not in kits:
+                raise ValueError(f"Kit {id_kit} não existe em kits")
+            _acumular_movimentos(estoque, saldo, _movimentos_kit(estoque, id_kit, tamanho_camisa, delta))
+        except ValueError as e:
+            falhas.append({"indice": i, "id_kit": id_kit, "tamanho_camisa": tamanho_camisa, "motivo": str(e)})
+    if not falhas:
+        _gravar_saldo(saldo)
+    return {
+        "reservados": 0 if falhas else len(demandas),
+        "falhas": falhas,
+    }
 
 
 def validar_estoque_para_kit(id_kit: str, tamanho_camisa: str) -> bool:
-    itens_kit = [row for row in read_csv(Kit) if row["id_kit"] == id_kit]
-    dados_estoque = read_csv(EstoqueItem)
-    checagens = []
-    for k in itens_kit:
-        nome_item = (k.get("item") or "")
-        tam_kit = (k.get("tamanho_camisa") or "").upper()
-        req = int(k.get("qntd") or 0)
+    estoque = _tabela_atual(EstoqueItem)
+    indice = estoque.indice(_chave_estoque)
+    necessario = {}
+    for nome_item, tam_kit, req in _linhas_kit(id_kit, tamanho_camisa):
         if req <= 0:
             continue
-        if "camisa" in nome_item.lower():
-            if tamanho_camisa and tam_kit == (tamanho_camisa or "").upper():
-                checagens.append((nome_item, tam_kit, req))
-        else:
-            checagens.append((nome_item, None, req))
-    for (nome_item, tam, req) in checagens:
-        alvo = None
-        for e in dados_estoque:
-            if e.get("id_kit") != id_kit:
-                continue
-            if (e.get("item") or "").lower() != nome_item.lower():
-                continue
-            if tam:
-                if (e.get("tamanho_camisa") or "").upper() != tam:
-                    continue
-            alvo = e
-            break
-        if not alvo:
-            return False
-        disponivel = int(alvo.get("qntd") or 0)
-        if disponivel < req:
+        posicoes = indice.get(_chave_item_estoque(id_kit, nome_item, tam_kit))
+        if not posicoes:
             return False
-    return True
+        necessario[posicoes[0]] = necessario.get(posicoes[0], 0) + req
+    return all(int(estoque.linhas[pos].get("qntd") or 0) >= req for pos, req in necessario.items())
 
 
 # ---------------- IMPORTAÇÃO DE COLABORADORES ---------------- #
 
-def importar_colaboradores(dados: list, usuario_exec: str = None):
-    write_csv(Colaborador, [])
+# Colunas da planilha que não são itens de kit (as demais trazem quantidades).
+COLUNAS_PLANILHA = {
+    "id","registro","nome","data adimissão","motivo","tipo vaga","posição","data nascto",
+    "cargo","área","área padrão","cpf","pis","cod. horário","descr. horário",
+    "tipo experiencia","cod. depto","descr depto","local de trabalho","empresa",
+    "grupo pgto","pcd","cod. unidade negócio","e-mail","telefone","superior imediato",
+    "data/hora","usuário","id banco","id agencia","nº da conta","dígito controle",
+    "estado","concatenar","gênero","tamanho camisa","kit"
+}
+
+
+def _itens_kit_planilha(row: dict) -> dict:
+    itens_kit = {}
+    for col, val in row.items():
+        if col not in COLUNAS_PLANILHA:
+            if val and str(val).isdigit() and int(val) > 0:
+                itens_kit[col] = int(val)
+    return itens_kit
+
+
+@transaction()
+def importar_colaboradores(dados: list, usuario_exec: str = None) -> dict:
+    """
+    Importa a planilha em uma única passada: gestores e kits novos são
+    resolvidos por mapas pré-carregados, os ids são reservados em bloco e
+    cada tabela é gravada uma vez no commit, junto com o lote de logs.
+    Substitui a tabela de colaboradores e devolve um resumo do que foi criado.
+    """
+    linhas = [
+        {k.strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+        for row in dados
+    ]
+    tabela_usuarios = _transacao_atual().escrever(Usuario)
+    tabela_kits = _transacao_atual().escrever(Kit)
+    gestores = {}
+    for u in tabela_usuarios:
+        gestores.setdefault(u["nome"], u["id_usuario"])
+    kits = {}
+    for k in tabela_kits:
+        kits.setdefault(k["nome_kit"], k["id_kit"])
+
+    novos_gestores, novos_kits = {}, {}
+    for row in linhas:
+        nome_gestor = row.get("superior imediato", "")
+        if nome_gestor and nome_gestor not in gestores:
+            novos_gestores.setdefault(nome_gestor, row.get("e-mail", ""))
+        nome_kit = row.get("kit", "")
+        if nome_kit and nome_kit not in kits:
+            novos_kits.setdefault(nome_kit, _itens_kit_planilha(row))
+
+    for (nome_gestor, email_gestor), id_usuario in zip(novos_gestores.items(), reservar_ids(Usuario, len(novos_gestores))):
+        novo_usuario = Usuario(id_usuario=id_usuario, nome=nome_gestor, email=email_gestor)
+        tabela_usuarios.inserir(_normalizar_linhas(Usuario, [asdict(novo_usuario)])[0])
+        gestores[nome_gestor] = id_usuario
+        log_action(usuario_exec, {
+            "acao": "REGISTRAR_USUARIO_AUTO",
+            "linha_antes": None,
+            "linha_depois": asdict(novo_usuario)
+        })
+    if novos_gestores:
+        _transacao_atual().marcar(Usuario)
+
+    for (nome_kit, itens_kit), id_kit in zip(novos_kits.items(), reservar_ids(Kit, len(novos_kits))):
+        # uma linha por item, no mesmo formato de kits_cadastrados.csv
+        linhas_kit = [asdict(Kit(id_kit=id_kit, nome_kit=nome_kit, item=item, qntd=qntd)) for item, qntd in itens_kit.items()]
+        for linha in _normalizar_linhas(Kit, linhas_kit or [asdict(Kit(id_kit=id_kit, nome_kit=nome_kit))]):
+            tabela_kits.inserir(linha)
+        kits[nome_kit] = id_kit
+        log_action(usuario_exec, {
+            "acao": "REGISTRAR_KIT_AUTO",
+            "linha_antes": None,
+            "linha_depois": {"id_kit": id_kit, "nome_kit": nome_kit, "itens_kit": itens_kit}
+        })
+    if novos_kits:
+        _transacao_atual().marcar(Kit)
+
     novos_colaboradores = []
-    criados_usuarios = 0
-    criados_kits = 0
-    for row in dados:
-        row = {k.strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+    for row, id_colaborador in zip(linhas, reservar_ids(Colaborador, len(linhas))):
         nome_gestor = row.get("superior imediato", "")
-        email_gestor = row.get("e-mail", "")
-        id_gestor = ""
-        if nome_gestor:
-            usuarios = read_csv(Usuario)
-            usuario_existente = next((u for u in usuarios if u["nome_usuario"] == nome_gestor), None)
-            if usuario_existente:
-                id_gestor = usuario_existente["id_usuario"]
-            else:
-                novo_usuario = Usuario(
-                    id_usuario=gerar_id(Usuario),
-                    nome_usuario=nome_gestor,
-                    email_usuario=email_gestor,
-                    senha_usuario="",
-                    id_agencia="",
-                    cidade="",
-                    uf=""
-                )
-                usuarios.append(asdict(novo_usuario))
-                write_csv(Usuario, usuarios)
-                id_gestor = novo_usuario.id_usuario
-                criados_usuarios += 1
-                log_action(usuario_exec, {
-                    "acao": "REGISTRAR_USUARIO_AUTO",
-                    "linha_antes": None,
-                    "linha_depois": asdict(novo_usuario)
-                })
         nome_kit = row.get("kit", "")
-        id_kit = ""
-        if nome_kit:
-            kits = read_csv(Kit)
-            kit_existente = next((k for k in kits if k["nome_kit"] == nome_kit), None)
-            if kit_existente:
-                id_kit = kit_existente["id_kit"]
-            else:
-                itens_kit = {}
-                for col, val in row.items():
-                    if col not in [
-                        "id","registro","nome","data adimissão","motivo","tipo vaga","posição","data nascto",
-                        "cargo","área","área padrão","cpf","pis","cod. horário","descr. horário",
-                        "tipo experiencia","cod. depto","descr depto","local de trabalho","empresa",
-                        "grupo pgto","pcd","cod. unidade negócio","e-mail","telefone","superior imediato",
-                        "data/hora","usuário","id banco","id agencia","nº da conta","dígito controle",
-                        "estado","concatenar","gênero","tamanho camisa","kit"
-                    ]:
-                        if val and str(val).isdigit() and int(val) > 0:
-                            itens_kit[col] = int(val)
-
-                novo_kit = Kit(
-                    id_kit=gerar_id(Kit),
-                    nome_kit=nome_kit,
-                    itens_kit=itens_kit
-                )
-                kits.append(asdict(novo_kit))
-                write_csv(Kit, kits)
-                id_kit = novo_kit.id_kit
-                criados_kits += 1
-                log_action(usuario_exec, {
-                    "acao": "REGISTRAR_KIT_AUTO",
-                    "linha_antes": None,
-                    "linha_depois": asdict(novo_kit)
-                })
         novo_colaborador = Colaborador(
-            id_colaborador=gerar_id(Colaborador),
+            id_colaborador=id_colaborador,
             nome_colaborador=row.get("nome", ""),
             email_colaborador=row.get("e-mail", ""),
-            id_gestor=id_gestor,
+            id_gestor=gestores.get(nome_gestor, "") if nome_gestor else "",
             nome_gestor=nome_gestor,
-            email_gestor=email_gestor,
-            id_kit=id_kit,
+            email_gestor=row.get("e-mail", ""),
+            id_kit=kits.get(nome_kit, "") if nome_kit else "",
             nome_kit=nome_kit,
             data_admissao=row.get("data adimissão", ""),
             tamanho_camisa=row.get("tamanho camisa", ""),
@@ -371,6 +1322,11 @@ def importar_colaboradores(dados: list, usuario_exec: str = None):
             "linha_antes": None,
             "linha_depois": c
         })
+    return {
+        "usuarios_criados": len(novos_gestores),
+        "kits_criados": len(novos_kits),
+        "colaboradores_importados": len(novos_colaboradores),
+    }
 
 
 # ---------------- CRUD ---------------- #
@@ -382,26 +1338,132 @@ def verificar_campos(modelo: Type, dados: dict) -> bool:
 
 
 def listar_registros(modelo: Type) -> List:
-    return dicts_to_objects(read_csv(modelo), modelo)
+    return list(iter_registros(modelo))
+
+
+def _filtrar(tabela, modelo: Type, where):
+    if where is None:
+        return iter(tabela)
+    if callable(where):
+        return (linha for linha in tabela if where(linha))
+    condicoes = dict(where)
+    indexada = next((c for c in condicoes if c == MODEL_ID_KEY[modelo] or tabela.tem_indice(c)), None)
+    if indexada is not None:
+        valor = condicoes.pop(indexada)
+        candidatas = (tabela.linhas[pos] for pos in tabela.posicoes(indexada, valor))
+    else:
+        candidatas = iter(tabela)
+    return (linha for linha in candidatas if all(linha.get(c, "") == v for c, v in condicoes.items()))
+
+
+def iter_registros(modelo: Type, where=None, fields=None):
+    """
+    Percorre a tabela sob demanda, sem materializar a lista inteira.
+    `where` filtra as linhas cruas antes de qualquer conversão: dict coluna -> valor
+    (igualdade; usa o índice da chave primária ou de colunas já indexadas) ou
+    função linha -> bool. Com `fields`, devolve dicts só com essas colunas;
+    sem, devolve objetos do modelo.
+    """
+    for linha in _filtrar(_tabela_atual(modelo), modelo, where):
+        if fields is not None:
+            yield {c: linha.get(c, "") for c in fields}
+        else:
+            yield row_to_record(modelo, linha)
+
+
+def _chave_ordenacao(valor):
+    """Números (ids, quantidades) comparados como números; o resto como texto sem caixa."""
+    valor = (valor or "").strip()
+    return (0, int(valor), "") if valor.isdigit() else (1, 0, valor.lower())
 
 
+def paginar_registros(modelo: Type, where=None, busca=None, ordem=None, desc=False, pagina=1, por_pagina=50):
+    """
+    Uma página da tabela. Filtro, busca e ordenação rodam sobre as linhas cruas;
+    só os registros da página viram objetos do modelo. `busca` é um dict
+    coluna -> termo (contém, sem diferenciar maiúsculas); `where` segue
+    iter_registros. A ordenação só mantém as primeiras `pagina * por_pagina`
+    linhas (heap), sem ordenar a tabela inteira.
+    """
+    colunas = {f.name for f in fields(modelo)}
+    for coluna in [*(busca or {}), *([ordem] if ordem else [])]:
+        if coluna not in colunas:
+            raise ValueError(f"Coluna inválida para {modelo.__name__}: {coluna}")
+    termos = {c: str(t).strip().lower() for c, t in (busca or {}).items() if str(t or "").strip()}
+    linhas = [l for l in _filtrar(_tabela_atual(modelo), modelo, where)
+              if all(t in (l.get(c) or "").lower() for c, t in termos.items())]
+
+    por_pagina = max(1, int(por_pagina))
+    total = len(linhas)
+    paginas = max(1, -(-total // por_pagina))
+    pagina = min(max(1, int(pagina)), paginas)
+    fim = pagina * por_pagina
+    if ordem:
+        chave = lambda linha: _chave_ordenacao(linha.get(ordem))
+        linhas = (heapq.nlargest if desc else heapq.nsmallest)(fim, linhas, key=chave)
+    return {
+        "registros": [row_to_record(modelo, l) for l in linhas[fim - por_pagina:fim]],
+        "total": total,
+        "pagina": pagina,
+        "paginas": paginas,
+        "por_pagina": por_pagina,
+    }
+
+
+def _ordem_id(chave: str):
+    """Ordem das chaves primárias: prefixo e depois o número, para C999 vir antes de C1000."""
+    prefixo = chave.rstrip("0123456789")
+    numero = chave[len(prefixo):]
+    return prefixo, int(numero) if numero else -1, chave
+
+
+def _montar_ordem_chaves(modelo: Type):
+    chave = MODEL_ID_KEY[modelo]
+    return lambda tabela: sorted(tabela.indice(chave), key=_ordem_id)
+
+
+# Chaves primárias ordenadas, por modelo: derivado da tabela (refeito só quando ela muda)
+_ORDEM_CHAVES = {modelo: _montar_ordem_chaves(modelo) for modelo in MODEL_ID_KEY}
+
+
+def listar_por_cursor(modelo: Type, cursor=None, limite=100, fields=None):
+    """
+    Listagem incremental na ordem da chave primária (numérica: C999, C1000): devolve
+    (registros, próximo cursor).
+    O cursor é a última chave entregue (None = do início); o próximo é None quando
+    não há mais linhas. Linhas com a mesma chave (kits) nunca ficam divididas entre
+    páginas. `fields` segue iter_registros.
+    """
+    tabela = _tabela_atual(modelo)
+    chaves = tabela.derivado(_ORDEM_CHAVES[modelo])
+    idx = tabela.indice(MODEL_ID_KEY[modelo])
+    inicio = bisect_right(chaves, _ordem_id(cursor), key=_ordem_id) if cursor is not None else 0
+    linhas, ultima = [], None
+    for chave in chaves[inicio:]:
+        if len(linhas) >= max(1, limite):
+            break
+        linhas.extend(tabela.linhas[pos] for pos in idx[chave])
+        ultima = chave
+    proximo = ultima if ultima is not None and ultima != chaves[-1] else None
+    if fields is not None:
+        return [{c: l.get(c, "") for c in fields} for l in linhas], proximo
+    return rows_to_records(modelo, linhas), proximo
+
+
+@transaction()
 def adicionar_registro(novo_registro, modelo: Type):
-    dados = read_csv(modelo)
-    chave_id = [f.name for f in fields(modelo) if f.name.startswith("id_")][0]
+    chave_id = MODEL_ID_KEY[modelo]
     setattr(novo_registro, chave_id, gerar_id(modelo))
     validar_relacionamentos(novo_registro, modelo)
     if modelo == Colaborador:
-        usuarios = read_csv(Usuario)
-        gestor = next((u for u in usuarios if u["id_usuario"] == novo_registro.id_gestor), None)
+        gestor = _buscar(Usuario, "id_usuario", novo_registro.id_gestor)
         if gestor:
             novo_registro.nome_gestor = gestor["nome"]
             novo_registro.email_gestor = gestor["email"]
-        kits = read_csv(Kit)
-        kit = next((k for k in kits if k["id_kit"] == novo_registro.id_kit), None)
+        kit = _buscar(Kit, "id_kit", novo_registro.id_kit)
         if kit:
             novo_registro.nome_kit = kit["nome_kit"]
-        agencias = read_csv(Agencia)
-        agencia = next((a for a in agencias if a["id_agencia"] == novo_registro.id_agencia), None)
+        agencia = _buscar(Agencia, "id_agencia", novo_registro.id_agencia)
         if agencia:
             novo_registro.cidade_envio = agencia["cidade_envio"]
             novo_registro.uf_envio = agencia["uf_envio"]
@@ -412,8 +1474,8 @@ def adicionar_registro(novo_registro, modelo: Type):
         ajustar_estoque_para_kit(id_kit, tamanho_camisa, delta=-1)
 
     linha_depois = asdict(novo_registro)
-    dados.append(linha_depois)
-    write_csv(modelo, dados)
+    _transacao_atual().escrever(modelo).inserir(_normalizar_linhas(modelo, [linha_depois])[0])
+    _transacao_atual().marcar(modelo)
 
     return {
         'acao': "REGISTRAR",
@@ -422,27 +1484,30 @@ def adicionar_registro(novo_registro, modelo: Type):
     }
 
 
+@transaction()
 def atualizar_registro(chave, valor_chave, novos_dados, modelo: Type):
-    dados = read_csv(modelo)
+    tabela = _transacao_atual().escrever(modelo)
     linha_antes, linha_depois = None, None
-    for d in dados:
-        if d.get(chave) == valor_chave:
-            linha_antes = d.copy()
-            if modelo == Colaborador:
-                id_kit_antigo = d["id_kit"]
-                tamanho_antigo = d.get("tamanho_camisa", "")
-                id_kit_novo = novos_dados.get("id_kit", id_kit_antigo)
-                tamanho_novo = novos_dados.get("tamanho_camisa", tamanho_antigo)
-
-                if id_kit_novo != id_kit_antigo or tamanho_novo != tamanho_antigo:
-                    ajustar_estoque_para_kit(id_kit_antigo, tamanho_antigo, delta=+1)
-                    if not validar_estoque_para_kit(id_kit_novo, tamanho_novo):
-                        raise ValueError(f"Estoque insuficiente para kit {id_kit_novo} (camisa {tamanho_novo})")
-                    ajustar_estoque_para_kit(id_kit_novo, tamanho_novo, delta=-1)
-            d.update({k: v for k, v in novos_dados.items() if v is not None})
-            linha_depois = d.copy()
-            break
-    write_csv(modelo, dados)
+    posicoes = tabela.posicoes(chave, valor_chave)
+    if posicoes:
+        pos = posicoes[0]
+        d = tabela.linhas[pos]
+        linha_antes = d.copy()
+        if modelo == Colaborador:
+            id_kit_antigo = d["id_kit"]
+            tamanho_antigo = d.get("tamanho_camisa", "")
+            id_kit_novo = novos_dados.get("id_kit", id_kit_antigo)
+            tamanho_novo = novos_dados.get("tamanho_camisa", tamanho_antigo)
+
+            if id_kit_novo != id_kit_antigo or tamanho_novo != tamanho_antigo:
+                ajustar_estoque_para_kit(id_kit_antigo, tamanho_antigo, delta=+1)
+                if not validar_estoque_para_kit(id_kit_novo, tamanho_novo):
+                    raise ValueError(f"Estoque insuficiente para kit {id_kit_novo} (camisa {tamanho_novo})")
+                ajustar_estoque_para_kit(id_kit_novo, tamanho_novo, delta=-1)
+        novos = {k: v for k, v in novos_dados.items() if v is not None}
+        tabela.atualizar(pos, _normalizar_valores(modelo, novos))
+        linha_depois = {**linha_antes, **novos}
+        _transacao_atual().marcar(modelo)
     return {
         'acao': "ATUALIZAR",
         'linha_antes': linha_antes,
@@ -450,22 +1515,21 @@ def atualizar_registro(chave, valor_chave, novos_dados, modelo: Type):
     }
 
 
+@transaction()
 def remover_registro(chave, valor_chave, modelo: Type):
-    dados = read_csv(modelo)
-    novos_dados = []
+    tabela = _transacao_atual().escrever(modelo)
     linha_antes = None
-    for d in dados:
-        if d.get(chave) == valor_chave:
-            linha_antes = d.copy()
-            if modelo == Colaborador:
-                id_kit = d["id_kit"]
-                tamanho_camisa = d.get("tamanho_camisa", "")
-                ajustar_estoque_para_kit(id_kit, tamanho_camisa, delta=+1)
-            continue 
-        novos_dados.append(d)
-    write_csv(modelo, novos_dados)
+    for pos in tabela.posicoes(chave, valor_chave):
+        d = tabela.linhas[pos]
+        linha_antes = d.copy()
+        if modelo == Colaborador:
+            id_kit = d["id_kit"]
+            tamanho_camisa = d.get("tamanho_camisa", "")
+            ajustar_estoque_para_kit(id_kit, tamanho_camisa, delta=+1)
+        tabela.remover(pos)
+        _transacao_atual().marcar(modelo)
     return {
         'acao': "REMOVER",
         'linha_antes': linha_antes,
         'linha_depois': None
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,126 @@
+import os, threading, time
+from contextlib import nullcontext
+from functools import wraps
+
+# Contadores e tempos do processo, em memória. Desligados por padrão (KITS_METRICAS=1
+# ou ativar()); desligados, cada ponto de medição custa só um teste de flag.
+
+_ativo = os.environ.get("KITS_METRICAS", "").strip().lower() in ("1", "true", "sim")
+_lock = threading.Lock()
+_contadores = {}  # (nome, rótulos) -> valor
+_tempos = {}      # (nome, rótulos) -> [chamadas, segundos, máximo]
+_NULO = nullcontext()
+
+PREFIXO = "kits_"
+
+
+# ---------------- CONTROLE ---------------- #
+
+def ativo() -> bool:
+    return _ativo
+
+def ativar(ligado: bool = True):
+    global _ativo
+    _ativo = ligado
+
+def zerar():
+    with _lock:
+        _contadores.clear()
+        _tempos.clear()
+
+
+# ---------------- COLETA ---------------- #
+
+def contar(nome: str, valor=1, **rotulos):
+    if not _ativo: return
+    chave = (nome, tuple(sorted(rotulos.items())))
+    with _lock:
+        _contadores[chave] = _contadores.get(chave, 0) + valor
+
+def observar(nome: str, segundos: float, **rotulos):
+    if not _ativo: return
+    chave = (nome, tuple(sorted(rotulos.items())))
+    with _lock:
+        atual = _tempos.get(chave)
+        if atual is None:
+            _tempos[chave] = [1, segundos, segundos]
+        else:
+            atual[0] += 1
+            atual[1] += segundos
+            if segundos > atual[2]: atual[2] = segundos
+
+
+class _Cronometro:
+    __slots__ = ("nome", "rotulos", "inicio")
+
+    def __init__(self, nome, rotulos):
+        self.nome, self.rotulos = nome, rotulos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observar(self.nome, time.perf_counter() - self.inicio, **self.rotulos)
+
+
+def cronometro(nome: str, **rotulos):
+    """`with cronometro(...)`: mede o bloco (contexto nulo, sem custo de relógio, se desligado)."""
+    return _Cronometro(nome, rotulos) if _ativo else _NULO
+
+def medir(nome: str, **rotulos):
+    """Decorador: mede cada chamada da função."""
+    def decorador(func):
+        @wraps(func)
+        def medida(*args, **kwargs):
+            if not _ativo: return func(*args, **kwargs)
+            with _Cronometro(nome, rotulos):
+                return func(*args, **kwargs)
+        return medida
+    return decorador
+
+
+# ---------------- EXPORTAÇÃO ---------------- #
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _rotulos_texto(rotulos):
+    return ",".join(f'{k}="{_escapar(v)}"' for k, v in rotulos)
+
+def snapshot() -> dict:
+    """{"contadores": {nome: {rótulos: valor}}, "tempos": {nome: {rótulos: {chamadas, segundos, max_segundos}}}}"""
+    with _lock:
+        contadores, tempos = dict(_contadores), {k: list(v) for k, v in _tempos.items()}
+    saida = {"ativo": _ativo, "contadores": {}, "tempos": {}}
+    for (nome, rotulos), valor in sorted(contadores.items()):
+        saida["contadores"].setdefault(nome, {})[_rotulos_texto(rotulos)] = valor
+    for (nome, rotulos), (chamadas, segundos, maximo) in sorted(tempos.items()):
+        saida["tempos"].setdefault(nome, {})[_rotulos_texto(rotulos)] = {
+            "chamadas": chamadas, "segundos": segundos, "max_segundos": maximo}
+    return saida
+
+def prometheus() -> str:
+    """Formato de texto do Prometheus: contadores como counter, tempos como summary (_count/_sum) + _max."""
+    with _lock:
+        contadores, tempos = dict(_contadores), {k: list(v) for k, v in _tempos.items()}
+    linhas, tipos = [], set()
+    def serie(nome, rotulos, valor):
+        linhas.append(f"{PREFIXO}{nome}{{{_rotulos_texto(rotulos)}}} {valor}" if rotulos else f"{PREFIXO}{nome} {valor}")
+    for (nome, rotulos), valor in sorted(contadores.items()):
+        if nome not in tipos:
+            tipos.add(nome)
+            linhas.append(f"# TYPE {PREFIXO}{nome} counter")
+        serie(nome, rotulos, valor)
+    for (nome, rotulos), (chamadas, segundos, _) in sorted(tempos.items()):
+        if nome not in tipos:
+            tipos.add(nome)
+            linhas.append(f"# TYPE {PREFIXO}{nome} summary")
+        serie(nome + "_count", rotulos, chamadas)
+        serie(nome + "_sum", rotulos, f"{segundos:.6f}")
+    for (nome, rotulos), (_, _, maximo) in sorted(tempos.items()):
+        if nome + "_max" not in tipos:
+            tipos.add(nome + "_max")
+            linhas.append(f"# TYPE {PREFIXO}{nome}_max gauge")
+        serie(nome + "_max", rotulos, f"{maximo:.6f}")
+    return "\n".join(linhas) + "\n"
@@ -1,32 +1,36 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from datetime import date
 from typing import Optional
 
-@dataclass
+# Registros com __slots__: sem __dict__ por instância, bem mais leves em tabelas grandes.
+# dataclass(slots=True) exige Python 3.10+ (o projeto pede 3.11+, ver README).
+
+@dataclass(slots=True)
 class Agencia:
     id_agencia: str = ""
     cidade_envio: str = ""
     uf_envio: str = ""
-    prazo_dias: str = ""
+    prazo_dias: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class Kit:
     id_kit: str = ""
     nome_kit: str = ""
     id_item: str = ""
     item: str = ""
     tamanho_camisa: Optional[str] = None
-    qntd: int = 0
+    qntd: Optional[int] = 0
 
-@dataclass
+@dataclass(slots=True)
 class EstoqueItem:
     id_item: str = ""
     item: str = ""
     tamanho_camisa: Optional[str] = None
     id_kit: str = ""
     nome_kit: str = ""
-    qntd: int = 0
+    qntd: Optional[int] = 0
 
-@dataclass
+@dataclass(slots=True)
 class Usuario:
     id_usuario: str = ""
     usuario: str = ""
@@ -36,7 +40,7 @@ class Usuario:
     id_classe: str = ""
     nome_classe: str = ""
 
-@dataclass
+@dataclass(slots=True)
 class Colaborador:
     id_colaborador : str = ""
     nome_colaborador : str = ""
@@ -46,11 +50,57 @@ class Colaborador:
     email_gestor : str = ""
     id_kit : str = ""
     nome_kit : str = ""
-    data_admissao : str = ""
+    data_admissao : Optional[date] = None
     tamanho_camisa: Optional[str] = None
     id_agencia : str = ""
     cidade_envio : str = ""
     uf_envio : str = ""
     situacao : str = ""
     id_registro : str = ""
-    cargo : str = ""
\ No newline at end of file
+    cargo : str = ""
+
+
+# ---------------- CONVERSÃO CSV <-> REGISTRO ---------------- #
+
+def _texto(valor):
+    return valor if valor != "" else None
+
+def _inteiro(valor):
+    if valor in ("", None): return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return valor  # valor legado fora do tipo: preservado como veio
+
+def _data(valor):
+    if valor in ("", None) or isinstance(valor, date): return valor or None
+    try:
+        return date.fromisoformat(valor)
+    except (TypeError, ValueError):
+        return valor
+
+_CONVERSORES = {int: _inteiro, Optional[int]: _inteiro, date: _data, Optional[date]: _data}
+_ESQUEMAS = {}
+
+def _esquema(modelo):
+    """[(campo, conversor)] do modelo, calculado uma vez por classe."""
+    esquema = _ESQUEMAS.get(modelo)
+    if esquema is None:
+        esquema = _ESQUEMAS[modelo] = tuple((f.name, _CONVERSORES.get(f.type, _texto)) for f in fields(modelo))
+    return esquema
+
+def row_to_record(modelo, linha: dict):
+    return modelo(*[conv(linha.get(nome, "")) for nome, conv in _esquema(modelo)])
+
+def rows_to_records(modelo, linhas):
+    """Construção em lote: converte os tipos (int, date) uma única vez, na carga."""
+    esquema = _esquema(modelo)
+    return [modelo(*[conv(l.get(nome, "")) for nome, conv in esquema]) for l in linhas]
+
+def record_to_row(registro) -> dict:
+    """Linha de CSV (somente texto) a partir de um registro."""
+    linha = {}
+    for nome, _ in _esquema(type(registro)):
+        valor = getattr(registro, nome)
+        linha[nome] = "" if valor is None else (valor.isoformat() if isinstance(valor, date) else str(valor))
+    return linha
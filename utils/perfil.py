@@ -0,0 +1,107 @@
+import cProfile, inspect, io, json, os, pstats, random, time
+from datetime import datetime
+
+# Perfil determinístico (cProfile) de uma requisição, sob demanda, com o tempo
+# dividido por fase. Fração das requisições perfiladas sem pedir: KITS_PERFIL
+# (0 = nenhuma, 1 = todas, 0.05 = uma em vinte). Só os KITS_PERFIS_MAX perfis
+# mais recentes ficam gravados (padrão 200).
+
+try:
+    FRACAO = float(os.environ.get("KITS_PERFIL") or 0)
+except ValueError:
+    FRACAO = 0.0
+
+try:
+    MAXIMO = max(1, int(os.environ.get("KITS_PERFIS_MAX") or 200))
+except ValueError:
+    MAXIMO = 200
+
+
+def sortear() -> bool:
+    return FRACAO > 0 and random.random() < FRACAO
+
+
+def chaves(*funcoes) -> set:
+    """Chaves do pstats (arquivo, linha, nome) das funções, atravessando decoradores."""
+    saida = set()
+    for f in funcoes:
+        codigo = inspect.unwrap(f).__code__
+        saida.add((codigo.co_filename, codigo.co_firstlineno, codigo.co_name))
+    return saida
+
+
+def chaves_classe(*classes) -> set:
+    return chaves(*[f for cls in classes for _, f in inspect.getmembers(cls, inspect.isfunction)])
+
+
+class Perfil:
+    """Liga o cProfile na criação; encerrar() desliga e prepara fases(), texto() e salvar()."""
+
+    def __init__(self):
+        self._perfil = cProfile.Profile()
+        self.inicio = time.perf_counter()
+        self.total = None
+        self.stats = None
+        self._perfil.enable()
+
+    def encerrar(self):
+        if self.stats is None:
+            self._perfil.disable()
+            self.total = time.perf_counter() - self.inicio
+            self.stats = pstats.Stats(self._perfil)
+        return self
+
+    def fases(self, grupos: dict) -> dict:
+        """
+        {fase: segundos} com `grupos` = {fase: função chave -> bool}. Conta só as
+        entradas na fase vindas de fora dela (chamadas internas não somam duas
+        vezes); fases diferentes podem se sobrepor, ex.: leitura feita dentro do render.
+        """
+        saida = {}
+        for fase, pertence in grupos.items():
+            segundos = 0.0
+            for chave, (_, _, _, acumulado, chamadores) in self.stats.stats.items():
+                if not pertence(chave):
+                    continue
+                if not chamadores:
+                    segundos += acumulado
+                for chamador, aresta in chamadores.items():
+                    if not pertence(chamador):
+                        segundos += aresta[3]
+            saida[fase] = segundos
+        saida["total"] = self.total
+        return saida
+
+    def texto(self, limite: int = 40, ordem: str = "cumulative") -> str:
+        buf = io.StringIO()
+        pstats.Stats(self._perfil, stream=buf).sort_stats(ordem).print_stats(limite)
+        return buf.getvalue()
+
+    def salvar(self, diretorio: str, nome: str, extra: dict = None) -> str:
+        """
+        Grava <nome>.prof (abre com pstats/snakeviz) e <nome>.json com as fases;
+        devolve o caminho do .prof. Apaga os mais antigos além de MAXIMO.
+        """
+        os.makedirs(diretorio, exist_ok=True)
+        base = os.path.join(diretorio, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{nome}")
+        self.stats.dump_stats(base + ".prof")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({"total_s": self.total, **(extra or {})}, f, ensure_ascii=False, indent=2)
+        podar(diretorio, MAXIMO)
+        return base + ".prof"
+
+
+def podar(diretorio: str, manter: int):
+    """Mantém só os `manter` perfis mais recentes (o nome começa pela data, então a ordem é a cronológica)."""
+    perfis = sorted(f[:-5] for f in os.listdir(diretorio) if f.endswith(".prof"))
+    for base in perfis[:-manter]:
+        for extensao in (".prof", ".json"):
+            try:
+                os.remove(os.path.join(diretorio, base + extensao))
+            except FileNotFoundError:
+                pass  # outro processo já apagou
+
+
+def server_timing(fases: dict) -> str:
+    """Cabeçalho Server-Timing (aparece na aba de rede do navegador)."""
+    return ", ".join(f"{fase};dur={segundos * 1000:.2f}" for fase, segundos in fases.items())
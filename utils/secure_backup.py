@@ -1,10 +1,23 @@
-import os, io, zipfile
+import os, io, json, zipfile, zlib, hashlib, threading, time
+from contextlib import contextmanager
 from cryptography.fernet import Fernet
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-DATA_DIR = os.path.join(BASE_DIR, "data")
+DATA_DIR = os.environ.get("KITS_DATA_DIR") or os.path.join(BASE_DIR, "data")
 KEY_PATH = os.path.join(DATA_DIR, ".secret.key")
-BACKUP_PATH = os.path.join(DATA_DIR, "backup.enc")
+BACKUP_PATH = os.path.join(DATA_DIR, "backup.enc")  # formato legado (zip único)
+SEGMENTS_DIR = os.path.join(DATA_DIR, "segments")
+MANIFEST_PATH = os.path.join(DATA_DIR, "manifest.json")
+LOG_PATH = os.path.join(DATA_DIR, "logs.enc")  # formato anterior (arquivo único), repartido por mês
+LOGS_DIR = os.path.join(DATA_DIR, "logs")
+LOCK_PATH = os.path.join(DATA_DIR, ".lock")
 
 
 # ---------------- AUXILIARES ---------------- #
@@ -23,22 +36,309 @@ def delete_files():
     files = [os.path.join(DATA_DIR,f) for f in os.listdir(DATA_DIR) if f.endswith(".csv")]
     for f in files: os.remove(f)
 
+def _write_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f: f.write(data)
+    os.replace(tmp, path)  # troca atômica: cada geração ganha um novo inode
+
+def segment_path(nome):
+    return os.path.join(SEGMENTS_DIR, nome + ".enc")
+
+
+# ---------------- TRAVAS ---------------- #
+
+def _travar_arquivo(arquivo, exclusiva):
+    if fcntl is not None:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX if exclusiva else fcntl.LOCK_SH)
+        return
+    arquivo.seek(0)
+    while True:  # msvcrt não tem trava compartilhada: leitores de processos diferentes se alternam
+        try:
+            msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+def _destravar_arquivo(arquivo):
+    if fcntl is not None:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+    else:
+        arquivo.seek(0)
+        msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class TravaLeituraEscrita:
+    """
+    Muitos leitores ou um escritor sobre o armazenamento, entre threads (Condition)
+    e entre processos (flock em data/.lock: compartilhado na leitura, exclusivo na
+    escrita). Escritores têm preferência. Reentrante no mesmo thread: quem escreve
+    pode ler e escrever de novo; quem só lê não pode passar a escrever. Com
+    entre_processos=False vale só entre threads e não toca no disco.
+    """
+
+    def __init__(self, caminho):
+        self._caminho = caminho
+        self._arquivo = None
+        self.entre_processos = True
+        self._leitura_no_arquivo = False
+        self._cond = threading.Condition()
+        self._leitores = 0
+        self._escritor = None
+        self._escritores_esperando = 0
+        self._local = threading.local()
+
+    def _arquivo_trava(self):
+        if self._arquivo is None:
+            os.makedirs(os.path.dirname(self._caminho), exist_ok=True)
+            self._arquivo = open(self._caminho, "a+b")
+        return self._arquivo
+
+    @contextmanager
+    def leitura(self):
+        profundidade = getattr(self._local, "leituras", 0)
+        if profundidade or self._escritor == threading.get_ident():
+            self._local.leituras = profundidade + 1
+            try:
+                yield
+            finally:
+                self._local.leituras = profundidade
+            return
+        with metrics.cronometro("trava_espera_segundos", modo="leitura"), self._cond:
+            while self._escritor is not None or self._escritores_esperando:
+                self._cond.wait()
+            if self._leitores == 0:
+                self._leitura_no_arquivo = self.entre_processos
+                if self._leitura_no_arquivo: _travar_arquivo(self._arquivo_trava(), exclusiva=False)
+            self._leitores += 1
+        self._local.leituras = 1
+        try:
+            yield
+        finally:
+            self._local.leituras = 0
+            with self._cond:
+                self._leitores -= 1
+                if self._leitores == 0:
+                    if self._leitura_no_arquivo: _destravar_arquivo(self._arquivo)
+                    self._cond.notify_all()
+
+    @contextmanager
+    def escrita(self):
+        eu = threading.get_ident()
+        if self._escritor == eu:
+            yield
+            return
+        if getattr(self._local, "leituras", 0):
+            raise RuntimeError("Escrita pedida dentro de uma leitura do mesmo thread")
+        inicio = time.perf_counter() if metrics.ativo() else None
+        with self._cond:
+            self._escritores_esperando += 1
+            try:
+                while self._escritor is not None or self._leitores:
+                    self._cond.wait()
+            finally:
+                self._escritores_esperando -= 1
+            self._escritor = eu
+        no_arquivo = self.entre_processos
+        try:
+            if no_arquivo: _travar_arquivo(self._arquivo_trava(), exclusiva=True)
+            if inicio is not None:
+                metrics.observar("trava_espera_segundos", time.perf_counter() - inicio, modo="escrita")
+            try:
+                yield
+            finally:
+                if no_arquivo: _destravar_arquivo(self._arquivo)
+        finally:
+            with self._cond:
+                self._escritor = None
+                self._cond.notify_all()
+
+
+TRAVA = TravaLeituraEscrita(LOCK_PATH)
+
+
+# ---------------- MANIFESTO ---------------- #
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH): return {"versao": 1, "tabelas": {}}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f: return json.load(f)
+
+def _save_manifest(manifest):
+    _write_atomic(MANIFEST_PATH, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+
+def _precisa_migrar():
+    return not os.path.exists(MANIFEST_PATH) and os.path.exists(BACKUP_PATH)
+
+def _migrar_backup_legado():
+    """Quebra o backup.enc monolítico em um segmento por tabela (executa uma única vez)."""
+    if not _precisa_migrar(): return
+    with TRAVA.escrita():
+        if not _precisa_migrar(): return  # outro thread/processo migrou enquanto esperávamos
+        data = Fernet(load_key()).decrypt(open(BACKUP_PATH,"rb").read())
+        with zipfile.ZipFile(io.BytesIO(data), "r") as z:
+            conteudos = {n: z.read(n) for n in z.namelist()}
+        write_tables(conteudos)
+        if not conteudos: _save_manifest(load_manifest())
+        os.replace(BACKUP_PATH, BACKUP_PATH + ".legado")
+
+
+# ---------------- SEGMENTOS ---------------- #
+
+def table_generation(nome):
+    """Identifica a versão atual do segmento (inode, mtime, tamanho) sem decifrar."""
+    _migrar_backup_legado()
+    try:
+        st = os.stat(segment_path(nome))
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def read_table(nome):
+    """Conteúdo decifrado de uma tabela (b"" se ainda não existir)."""
+    return read_table_versioned(nome)[1]
+
+@metrics.medir("armazenamento_segundos", operacao="read_table")
+def read_table_versioned(nome):
+    """(geração, conteúdo) lidos do mesmo arquivo: a geração é a do segmento efetivamente lido."""
+    _migrar_backup_legado()
+    with TRAVA.leitura():
+        try:
+            f = open(segment_path(nome), "rb")
+        except FileNotFoundError:
+            return None, b""
+        with f:
+            st = os.fstat(f.fileno())
+            cifrado = f.read()
+    metrics.contar("bytes_decifrados_total", len(cifrado), tabela=nome)
+    return (st.st_ino, st.st_mtime_ns, st.st_size), zlib.decompress(Fernet(load_key()).decrypt(cifrado))
+
+def write_table(nome, conteudo):
+    """Cifra e grava somente o segmento da tabela informada."""
+    write_tables({nome: conteudo})
+
+def _inalterada(manifest, nome, sha256):
+    return manifest["tabelas"].get(nome, {}).get("sha256") == sha256 and os.path.exists(segment_path(nome))
+
+@metrics.medir("armazenamento_segundos", operacao="write_tables")
+def write_tables(conteudos):
+    """
+    Grava vários segmentos de uma vez, atualizando o manifesto uma única vez.
+    Tabelas com o mesmo sha256 do manifesto já estão gravadas: não são
+    comprimidas, cifradas nem regravadas (e a geração não muda).
+    """
+    if not conteudos: return
+    hashes = {nome: hashlib.sha256(c).hexdigest() for nome, c in conteudos.items()}
+    manifest = load_manifest()
+    sujas = [nome for nome in conteudos if not _inalterada(manifest, nome, hashes[nome])]
+    fernet = Fernet(load_key()) if sujas else None
+    cifrados = {nome: fernet.encrypt(zlib.compress(conteudos[nome])) for nome in sujas}  # fora da trava
+    with TRAVA.escrita():
+        manifest = load_manifest()  # outro escritor pode ter gravado enquanto cifrávamos
+        sujas = [nome for nome in conteudos if not _inalterada(manifest, nome, hashes[nome])]
+        for nome in conteudos.keys() - set(sujas):
+            metrics.contar("segmentos_inalterados_total", tabela=nome)
+        if not sujas: return
+        os.makedirs(SEGMENTS_DIR, exist_ok=True)
+        for nome in sujas:
+            cifrado = cifrados.get(nome) or (fernet or Fernet(load_key())).encrypt(zlib.compress(conteudos[nome]))
+            metrics.contar("bytes_cifrados_total", len(cifrado), tabela=nome)
+            _write_atomic(segment_path(nome), cifrado)
+            anterior = manifest["tabelas"].get(nome, {})
+            manifest["tabelas"][nome] = {
+                "segmento": os.path.basename(segment_path(nome)),
+                "sha256": hashes[nome],
+                "bytes": len(conteudos[nome]),
+                "geracao": anterior.get("geracao", 0) + 1,
+            }
+        _save_manifest(manifest)
+
+def delete_table(nome):
+    with TRAVA.escrita():
+        manifest = load_manifest()
+        if manifest["tabelas"].pop(nome, None) is not None: _save_manifest(manifest)
+        if os.path.exists(segment_path(nome)): os.remove(segment_path(nome))
+
+
+# ---------------- LOG (SOMENTE ANEXAÇÃO) ---------------- #
+# Um arquivo por período (mês): logs/AAAA-MM.enc. Cada linha é um registro cifrado
+# individualmente; anexar nunca reescreve o que já foi gravado e consultas por
+# período abrem só os meses pedidos.
+
+def log_path(periodo):
+    return os.path.join(LOGS_DIR, periodo + ".enc")
+
+def log_periods():
+    """Períodos com log gravado, em ordem."""
+    if not os.path.isdir(LOGS_DIR): return []
+    return sorted(f[:-4] for f in os.listdir(LOGS_DIR) if f.endswith(".enc"))
+
+@metrics.medir("armazenamento_segundos", operacao="append_log")
+def append_log(registros, periodo):
+    """Cifra cada registro individualmente e anexa ao fim do log do período, sem reescrever o resto."""
+    if not registros: return
+    fernet = Fernet(load_key())
+    bloco = b"".join(fernet.encrypt(r) + b"\n" for r in registros)
+    metrics.contar("bytes_cifrados_total", len(bloco), tabela=os.path.basename(log_path(periodo)))
+    metrics.contar("log_registros_total", len(registros), sentido="anexados")
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    with TRAVA.escrita():
+        with open(log_path(periodo), "ab") as f: f.write(bloco)  # uma única escrita por lote
+
+def log_size(periodo):
+    try:
+        return os.path.getsize(log_path(periodo))
+    except FileNotFoundError:
+        return 0
+
+def read_log_from(periodo, inicio):
+    """(posição após o registro, registro) a partir do byte `inicio`, para retomar a leitura de onde parou."""
+    caminho = log_path(periodo)
+    if not os.path.exists(caminho): return
+    with TRAVA.leitura():
+        limite = os.path.getsize(caminho)  # só lotes completos; o que for anexado depois fica de fora
+    fernet = Fernet(load_key())
+    with open(caminho, "rb") as f:
+        f.seek(inicio)
+        posicao = inicio
+        for linha in f:
+            posicao += len(linha)
+            if posicao > limite: break
+            linha = linha.strip()
+            if linha:
+                metrics.contar("log_registros_total", sentido="lidos")
+                yield posicao, fernet.decrypt(linha)
+
+def split_log(periodo_de):
+    """
+    Reparte o logs.enc único (formato anterior) nos arquivos por período, copiando
+    as linhas cifradas como estão; `periodo_de(registro decifrado)` diz o período.
+    Executa uma única vez: o arquivo antigo fica como logs.enc.legado.
+    """
+    if not os.path.exists(LOG_PATH): return
+    with TRAVA.escrita():
+        if not os.path.exists(LOG_PATH): return  # outro thread/processo já repartiu
+        fernet = Fernet(load_key())
+        por_periodo = {}
+        with open(LOG_PATH, "rb") as f:
+            for linha in f:
+                linha = linha.strip()
+                if linha: por_periodo.setdefault(periodo_de(fernet.decrypt(linha)), []).append(linha + b"\n")
+        os.makedirs(LOGS_DIR, exist_ok=True)
+        for periodo, linhas in por_periodo.items():
+            with open(log_path(periodo), "ab") as f: f.write(b"".join(linhas))
+        os.replace(LOG_PATH, LOG_PATH + ".legado")
+
 
 # ---------------- GERENCIADOR ---------------- #
 
+@metrics.medir("armazenamento_segundos", operacao="backup_data")
 def backup_data():
+    """Guarda os CSVs em claro de DATA_DIR nos segmentos (só os que mudaram) e os apaga."""
     files = [os.path.join(DATA_DIR,f) for f in os.listdir(DATA_DIR) if f.endswith(".csv")]
     if not files: return  # Não há CSVs para fazer backup
-    
-    mem = io.BytesIO()
-    with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as z: 
-        [z.write(f, os.path.basename(f)) for f in files]
-    data = Fernet(load_key()).encrypt(mem.getvalue())
-    with open(BACKUP_PATH, "wb") as f: f.write(data)
-    delete_files()
-
-def restore_data():
-    if not os.path.exists(BACKUP_PATH): return
-    data = Fernet(load_key()).decrypt(open(BACKUP_PATH,"rb").read())
-    mem = io.BytesIO(data)
-    with zipfile.ZipFile(mem, "r") as z: z.extractall(DATA_DIR)
\ No newline at end of file
+    _migrar_backup_legado()
+    with TRAVA.escrita():
+        conteudos = {}
+        for f in files:
+            with open(f, "rb") as arq: conteudos[os.path.basename(f)] = arq.read()
+        write_tables(conteudos)
+        delete_files()